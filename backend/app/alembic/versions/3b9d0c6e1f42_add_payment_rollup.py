@@ -0,0 +1,63 @@
+"""Add payment rollup
+
+Revision ID: 3b9d0c6e1f42
+Revises: 690b3f35cf5b
+Create Date: 2026-10-18 10:12:40.518203
+
+"""
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b9d0c6e1f42"
+down_revision = "690b3f35cf5b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("payment", sa.Column("group_id", sa.Integer(), nullable=True))
+    op.create_table(
+        "paymentrollup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.Column("method", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("reason", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("payments", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_paymentrollup_key",
+        "paymentrollup",
+        ["month", sa.text("coalesce(group_id, 0)"), "method", "reason"],
+        unique=True,
+    )
+
+    # Account existing payments to the first group their student joined
+    op.execute(
+        """
+        UPDATE payment SET group_id = (
+            SELECT groupstudentlink.group_id FROM groupstudentlink
+            WHERE groupstudentlink.student_id = payment.student_id
+            ORDER BY groupstudentlink.joined_at, groupstudentlink.group_id
+            LIMIT 1
+        )
+    """
+    )
+    op.execute(
+        """
+        INSERT INTO paymentrollup (month, group_id, method, reason, amount, payments)
+        SELECT CAST(date_trunc('month', day) AS DATE), group_id, method, reason, sum(amount), count(*)
+        FROM payment
+        GROUP BY 1, 2, 3, 4
+    """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_paymentrollup_key", table_name="paymentrollup")
+    op.drop_table("paymentrollup")
+    op.drop_column("payment", "group_id")
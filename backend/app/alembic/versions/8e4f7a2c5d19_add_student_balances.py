@@ -0,0 +1,56 @@
+"""Add student balances
+
+Revision ID: 8e4f7a2c5d19
+Revises: 3b9d0c6e1f42
+Create Date: 2026-10-18 11:02:17.240961
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8e4f7a2c5d19"
+down_revision = "3b9d0c6e1f42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "studentbalance",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("student_id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("lessons_attended", sa.Integer(), nullable=False),
+        sa.Column("amount_paid", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["student_id"],
+            ["student.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("student_id", "month"),
+    )
+
+    # Backfill from the attendance and tuition payment history
+    op.execute(
+        """
+        INSERT INTO studentbalance (student_id, month, lessons_attended, amount_paid)
+        SELECT student_id, month, sum(lessons_attended), sum(amount_paid)
+        FROM (
+            SELECT lessonstudentlink.student_id, CAST(date_trunc('month', lesson.day) AS DATE) AS month,
+                   count(*) AS lessons_attended, 0 AS amount_paid
+            FROM lessonstudentlink JOIN lesson ON lesson.id = lessonstudentlink.lesson_id
+            GROUP BY 1, 2
+            UNION ALL
+            SELECT student_id, CAST(date_trunc('month', day) AS DATE), 0, sum(amount)
+            FROM payment
+            WHERE reason IN ('one_month', 'half_month', 'one_lesson')
+            GROUP BY 1, 2
+        ) AS totals
+        GROUP BY student_id, month
+    """
+    )
+
+
+def downgrade():
+    op.drop_table("studentbalance")
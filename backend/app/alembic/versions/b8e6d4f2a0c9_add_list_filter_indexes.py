@@ -0,0 +1,40 @@
+"""Add list filter indexes
+
+Revision ID: b8e6d4f2a0c9
+Revises: f4d8a6c2e0b5
+Create Date: 2026-10-18 16:41:09.502317
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b8e6d4f2a0c9"
+down_revision = "f4d8a6c2e0b5"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns)
+INDEXES = [
+    ("ix_lesson_day_id", "lesson", ["day", "id"]),
+    ("ix_payment_day_id", "payment", ["day", "id"]),
+    ("ix_payment_method_day_id", "payment", ["method", "day", "id"]),
+    ("ix_payment_reason_day_id", "payment", ["reason", "day", "id"]),
+]
+
+
+def upgrade():
+    # Built concurrently, see c5a1e9d3b7f0_add_foreign_key_indexes
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(
+                name, table_name=table, if_exists=True, postgresql_concurrently=True
+            )
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, if_exists=True, postgresql_concurrently=True
+            )
@@ -0,0 +1,45 @@
+"""Add foreign key indexes
+
+Revision ID: c5a1e9d3b7f0
+Revises: 8e4f7a2c5d19
+Create Date: 2026-10-18 11:48:03.615290
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c5a1e9d3b7f0"
+down_revision = "8e4f7a2c5d19"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, unique)
+INDEXES = [
+    ("ix_lesson_group_id_day", "lesson", ["group_id", "day"], True),
+    ("ix_payment_student_id_day", "payment", ["student_id", "day"], False),
+    ("ix_lessonstudentlink_student_id", "lessonstudentlink", ["student_id"], False),
+    ("ix_groupstudentlink_student_id", "groupstudentlink", ["student_id"], False),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not lock out writes but cannot run in a
+    # transaction. A failed build leaves an INVALID index behind, so existing
+    # ones are dropped first and the migration can simply be run again (e.g.
+    # after removing duplicated lessons).
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.drop_index(
+                name, table_name=table, if_exists=True, postgresql_concurrently=True
+            )
+            op.create_index(
+                name, table, columns, unique=unique, postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, *_ in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, if_exists=True, postgresql_concurrently=True
+            )
@@ -0,0 +1,52 @@
+"""Add student search index
+
+Revision ID: f4d8a6c2e0b5
+Revises: e9f3b5d1c7a2
+Create Date: 2026-10-18 16:02:37.118204
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f4d8a6c2e0b5"
+down_revision = "e9f3b5d1c7a2"
+branch_labels = None
+depends_on = None
+
+# Must match models.STUDENT_SEARCH_DOCUMENT
+SEARCH_DOCUMENT = (
+    "coalesce(full_name, '') || ' ' || coalesce(city, '') || ' ' "
+    "|| coalesce(responsible_adult_full_name, '')"
+)
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Built concurrently so the student table stays writable, see
+    # c5a1e9d3b7f0_add_foreign_key_indexes
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_student_search_trgm",
+            table_name="student",
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_student_search_trgm",
+            "student",
+            [sa.text(f"({SEARCH_DOCUMENT}) gin_trgm_ops")],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_student_search_trgm",
+            table_name="student",
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+    # The pg_trgm extension is left installed, other objects may depend on it
@@ -0,0 +1,48 @@
+from collections.abc import Sequence
+from typing import Any
+
+from fastapi import HTTPException, Query
+from sqlalchemy import Select
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Most ids a single batch lookup may ask for
+MAX_BATCH_IDS = 1000
+
+
+def batch_ids(
+    ids: str | None = Query(
+        None,
+        description="Comma separated ids to fetch, in that order, replaces pagination",
+    ),
+) -> list[int] | None:
+    if ids is None:
+        return None
+    try:
+        return [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+
+
+async def fetch_by_ids(
+    session: AsyncSession,
+    statement: Select[Any],
+    key: InstrumentedAttribute[int],
+    ids: Sequence[int],
+) -> list[Any]:
+    """
+    Run `statement` for the rows whose `key` is in `ids` with a single IN
+    query, returning them in the order of `ids`. Unknown and repeated ids are
+    skipped.
+    """
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_IDS} ids can be fetched at once",
+        )
+    if not ids:
+        return []
+    rows = (await session.execute(statement.where(key.in_(ids)))).scalars().all()
+    by_id = {getattr(row, key.key): row for row in rows}
+    return [by_id[id] for id in ids if id in by_id]
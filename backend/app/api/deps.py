@@ -1,16 +1,20 @@
-from collections.abc import Generator
+import hashlib
+import ipaddress
+from collections.abc import AsyncGenerator, Awaitable, Callable, Generator
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import ValidationError
-from sqlmodel import Session
+from sqlmodel import Session, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
+from app.core.cache import cache_user, user_cache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, engine
+from app.models import TableVersion, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -22,22 +26,65 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Objects are not expired on commit: lazy loads are not available under
+    # asyncio, so routes load what they return up front.
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(proxy, strict=False)
+        for proxy in settings.TRUSTED_PROXIES
+    )
+
+
+def get_client_ip(request: Request) -> str | None:
+    """
+    IP of the client. Behind TRUSTED_PROXIES it is the last X-Forwarded-For
+    entry not added by one of them, the header is ignored otherwise so
+    clients can't pick their own IP.
+    """
+    host = request.client.host if request.client else None
+    if not host or not _is_trusted_proxy(host):
+        return host
+    forwarded_for = ",".join(request.headers.getlist("X-Forwarded-For"))
+    for forwarded in reversed(forwarded_for.split(",")):
+        forwarded = forwarded.strip()
+        if forwarded:
+            host = forwarded
+            if not _is_trusted_proxy(host):
+                break
+    return host
+
+
+ClientIP = Annotated[str | None, Depends(get_client_ip)]
+
+
+def decode_token(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+
+
+def check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -45,7 +92,28 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    token_data = decode_token(token)
+    cached = user_cache.get(token_data.sub) if token_data.sub else None
+    if cached:
+        return session.merge(cached, load=False)
+    user = check_user(session.get(User, token_data.sub))
+    cache_user(user)
+    return user
+
+
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    token_data = decode_token(token)
+    cached = user_cache.get(token_data.sub) if token_data.sub else None
+    if cached:
+        return await session.merge(cached, load=False)
+    user = check_user(await session.get(User, token_data.sub))
+    cache_user(user)
+    return user
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
 
 
 def get_current_active_superuser(current_user: CurrentUser) -> User:
@@ -54,3 +122,69 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
             status_code=400, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class ConditionalGet:
+    """
+    ETag of a GET response, computed from the request, the caller and the
+    versions of the `tables` it reads. Routes await `check` once the caller
+    is authorized: a matching If-None-Match answers 304 before the route
+    runs its queries.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        response: Response,
+        session: AsyncSession,
+        current_user: User,
+        tables: tuple[str, ...],
+    ) -> None:
+        self.request = request
+        self.response = response
+        self.session = session
+        self.current_user = current_user
+        self.tables = tables
+
+    async def check(self) -> None:
+        statement = select(TableVersion.table_name, TableVersion.version).where(
+            col(TableVersion.table_name).in_(self.tables)
+        )
+        versions = dict((await self.session.exec(statement)).all())
+        key = " ".join(
+            [
+                self.request.url.path,
+                str(self.request.query_params),
+                f"user:{self.current_user.id}:{self.current_user.is_superuser}",
+            ]
+            + [f"{table}:{versions.get(table, 0)}" for table in sorted(self.tables)]
+        )
+        etag = f'"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}"'
+        if _etag_matches(self.request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers={"ETag": etag})
+        self.response.headers["ETag"] = etag
+
+
+def conditional_get(
+    tables: tuple[str, ...],
+) -> Callable[..., Awaitable[ConditionalGet]]:
+    """
+    Dependency giving routes the `ConditionalGet` of the `tables` they read.
+    """
+
+    async def get_conditional_get(
+        request: Request,
+        response: Response,
+        session: AsyncSessionDep,
+        current_user: AsyncCurrentUser,
+    ) -> ConditionalGet:
+        return ConditionalGet(request, response, session, current_user, tables)
+
+    return get_conditional_get
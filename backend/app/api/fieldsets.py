@@ -0,0 +1,136 @@
+from collections.abc import Callable, Mapping, Sequence
+from typing import Any
+
+import pydantic_core
+from fastapi import HTTPException, Query
+from pydantic import TypeAdapter
+from sqlalchemy.orm import InstrumentedAttribute, load_only
+from sqlalchemy.sql.base import ExecutableOption
+from sqlmodel import SQLModel
+from starlette.responses import Response
+
+
+def _names(value: str | None) -> list[str] | None:
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class Fieldset:
+    """
+    Columns and relationships a list request asked for with `fields=` and
+    `include=`.
+
+    `fields` restricts a page to some columns of the response model (all of
+    them by default) and `include` to some of its relationships (all of them
+    by default, none when only `fields` is given). Without either the page
+    has the full response model shape.
+    """
+
+    def __init__(
+        self,
+        model: type[SQLModel],
+        columns: Sequence[str],
+        includes: Mapping[str, tuple[TypeAdapter[Any], Sequence[ExecutableOption]]],
+        fields: list[str] | None,
+        include: list[str] | None,
+    ) -> None:
+        for name in fields or []:
+            if name not in columns:
+                detail = (
+                    f"Use include= for {name}"
+                    if name in includes
+                    else f"Unknown field: {name}"
+                )
+                raise HTTPException(status_code=400, detail=detail)
+        for name in include or []:
+            if name not in includes:
+                raise HTTPException(status_code=400, detail=f"Cannot include: {name}")
+        self.model = model
+        self.sparse = fields is not None or include is not None
+        # Requested names, in response model order
+        self.columns = [name for name in columns if fields is None or name in fields]
+        if include is None:
+            include = [] if fields is not None else list(includes)
+        self.includes = {name: includes[name] for name in includes if name in include}
+
+    def options(
+        self, keys: Sequence[InstrumentedAttribute[Any]] = ()
+    ) -> list[ExecutableOption]:
+        """
+        Loader options selecting the requested columns, plus the sort `keys`
+        pagination reads, and loading the requested relationships.
+        """
+        options = [
+            option for _, loaders in self.includes.values() for option in loaders
+        ]
+        if self.sparse:
+            attributes = [getattr(self.model, name) for name in self.columns]
+            attributes += [key for key in keys if key.key not in self.columns]
+            if attributes:
+                options.append(load_only(*attributes))
+        return options
+
+    def dump(self, obj: Any) -> dict[str, Any]:
+        row = {name: getattr(obj, name) for name in self.columns}
+        for name, (adapter, _) in self.includes.items():
+            row[name] = adapter.validate_python(
+                getattr(obj, name), from_attributes=True
+            )
+        return row
+
+    def page(
+        self,
+        page_model: type[SQLModel],
+        response: Response,
+        *,
+        data: list[Any],
+        **values: Any,
+    ) -> Any:
+        """
+        The page as `page_model` when the full shape was requested, or else
+        as a JSON response carrying the headers set on `response` (e.g. the
+        ETag of a conditional GET).
+        """
+        if not self.sparse:
+            return page_model(data=data, **values)
+        content = pydantic_core.to_json(
+            {"data": [self.dump(obj) for obj in data], **values}
+        )
+        sparse = Response(
+            content,
+            status_code=response.status_code or 200,
+            media_type="application/json",
+        )
+        sparse.headers.raw.extend(response.headers.raw)
+        return sparse
+
+
+def sparse_fieldset(
+    model: type[SQLModel],
+    out_model: type[SQLModel],
+    includes: Mapping[str, Sequence[ExecutableOption]],
+) -> Callable[..., Fieldset]:
+    """
+    Dependency parsing `fields=` and `include=` for a list of `out_model`
+    pages built from `model` rows. `includes` maps the relationships of
+    `out_model` to the loader options fetching them.
+    """
+    columns = [name for name in out_model.model_fields if name not in includes]
+    adapters = {
+        name: (TypeAdapter(out_model.model_fields[name].annotation), loaders)
+        for name, loaders in includes.items()
+    }
+
+    def dependency(
+        fields: str | None = Query(
+            None, description=f"Comma separated fields to return: {', '.join(columns)}"
+        ),
+        include: str | None = Query(
+            None,
+            description=f"Comma separated relationships to embed: {', '.join(includes)}",
+        ),
+    ) -> Fieldset:
+        return Fieldset(model, columns, adapters, _names(fields), _names(include))
+
+    return dependency
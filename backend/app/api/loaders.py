@@ -0,0 +1,40 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import Group, Lesson, Payment, Student
+
+# Loader options matching the relationships serialized by each response model,
+# so that a page of rows costs a fixed number of queries whatever its size,
+# and the tables the response model reads, for conditional GETs.
+
+# StudentOut: student + group_links
+STUDENT_OUT = (selectinload(Student.group_links),)
+STUDENT_OUT_TABLES = ("student", "groupstudentlink")
+
+# GroupOut: group + student_links
+GROUP_OUT = (selectinload(Group.student_links),)
+GROUP_OUT_TABLES = ("group", "groupstudentlink")
+
+# LessonOut: lesson + group (GroupOut) + assistants (StudentOut)
+LESSON_GROUP = (joinedload(Lesson.group).selectinload(Group.student_links),)
+LESSON_ASSISTANTS = (selectinload(Lesson.assistants).selectinload(Student.group_links),)
+LESSON_OUT = (*LESSON_GROUP, *LESSON_ASSISTANTS)
+# GroupAttendance: group + lessons + assistants + members
+GROUP_ATTENDANCE_TABLES = ("group", "lesson", "lessonstudentlink", "groupstudentlink")
+
+LESSON_OUT_TABLES = (
+    "lesson",
+    "lessonstudentlink",
+    "group",
+    "groupstudentlink",
+    "student",
+)
+
+# PaymentOut: payment + student (StudentOut)
+PAYMENT_OUT = (joinedload(Payment.student).selectinload(Student.group_links),)
+PAYMENT_OUT_TABLES = ("payment", "student", "groupstudentlink")
+
+# Relationships list routes embed on request (`include=`), by name
+STUDENT_INCLUDES = {"group_links": STUDENT_OUT}
+GROUP_INCLUDES = {"student_links": GROUP_OUT}
+LESSON_INCLUDES = {"group": LESSON_GROUP, "assistants": LESSON_ASSISTANTS}
+PAYMENT_INCLUDES = {"student": PAYMENT_OUT}
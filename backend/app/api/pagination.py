@@ -0,0 +1,221 @@
+import base64
+import binascii
+import datetime
+import json
+from collections.abc import Sequence
+from typing import Any, Literal
+
+from fastapi import HTTPException
+from sqlalchemy import (
+    BigInteger,
+    ColumnElement,
+    Row,
+    Select,
+    cast,
+    column,
+    func,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.orm import InstrumentedAttribute, noload
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# How list routes compute their total: `exact` counts matching rows,
+# `estimate` reads the planner statistics for unfiltered listings (falling
+# back to `exact` when filtered) and `none` skips counting altogether.
+CountMode = Literal["exact", "estimate", "none"]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    Encode the sort key values of the last row of a page into an opaque cursor.
+    """
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, datetime.date) else v for v in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _coerce(key: InstrumentedAttribute[Any], value: Any) -> Any:
+    python_type = key.type.python_type
+    if python_type is datetime.datetime:
+        return datetime.datetime.fromisoformat(value)
+    if python_type is datetime.date:
+        return datetime.date.fromisoformat(value)
+    if not isinstance(value, python_type):
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence[InstrumentedAttribute[Any]]) -> list[Any]:
+    """
+    Decode a cursor produced by `encode_cursor` back into typed sort key values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [_coerce(key, value) for key, value in zip(keys, values, strict=True)]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_statement(
+    statement: Select[Any],
+    keys: Sequence[InstrumentedAttribute[Any]],
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    descending: bool = False,
+    count: CountMode = "exact",
+) -> Select[Any]:
+    """
+    Order `statement` by `keys`, restrict it to one page and attach the total.
+
+    With a `cursor` the page starts right after the row the cursor points to
+    (keyset pagination) and `skip` is ignored; otherwise `skip` is used as an
+    offset. One extra row is fetched so `page_result` can tell whether there
+    is a next page.
+
+    The total is returned as an extra column of every row: a window count in
+    offset mode, a count over the uncursored statement in keyset mode, and
+    the planner row estimate from `pg_class` for unfiltered `estimate` counts.
+    """
+    total: ColumnElement[Any] | None = None
+    if count == "estimate" and statement.whereclause is None:
+        table_name = keys[0].class_.__tablename__
+        total = (
+            select(cast(column("reltuples"), BigInteger))
+            .select_from(text("pg_class"))
+            .where(column("oid") == func.to_regclass(table_name))
+            .scalar_subquery()
+        )
+    elif count != "none" and cursor is not None:
+        total = count_statement(statement).scalar_subquery()
+    elif count != "none":
+        total = func.count().over()
+
+    statement = statement.order_by(
+        *(key.desc() if descending else key.asc() for key in keys)
+    )
+    if cursor is not None:
+        row_key = tuple_(*keys)
+        boundary = tuple_(*decode_cursor(cursor, keys))
+        statement = statement.where(
+            row_key < boundary if descending else row_key > boundary
+        )
+    elif skip:
+        statement = statement.offset(skip)
+    if total is not None:
+        statement = statement.add_columns(total.label("total"))
+    return statement.limit(limit + 1)
+
+
+def count_statement(statement: Select[Any]) -> Select[Any]:
+    """
+    Exact count of the rows matched by an unpaginated list statement.
+    """
+    return select(func.count()).select_from(
+        statement.options(noload("*")).order_by(None).subquery()
+    )
+
+
+def page_result(
+    rows: Sequence[Row[Any]],
+    keys: Sequence[InstrumentedAttribute[Any]],
+    *,
+    limit: int,
+    count: CountMode = "exact",
+) -> tuple[list[Any], int | None, str | None]:
+    """
+    Split the rows of a `page_statement` into the page data, the total and
+    the cursor of the next page.
+
+    The total is None when it could not be read from the page itself: when
+    the page is empty or the planner has no estimate yet the caller should
+    fall back to `count_statement`.
+    """
+    data = [row[0] for row in rows[:limit]]
+    total = None
+    if count != "none" and rows:
+        total = rows[0].total
+        if total is not None and total < 0:
+            total = None
+    next_cursor = None
+    if len(rows) > limit and data:
+        next_cursor = encode_cursor([getattr(data[-1], key.key) for key in keys])
+    return data, total, next_cursor
+
+
+def fetch_page(
+    session: Session,
+    statement: Select[Any],
+    keys: Sequence[InstrumentedAttribute[Any]],
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    descending: bool = False,
+    count: CountMode = "exact",
+) -> tuple[list[Any], int | None, str | None]:
+    """
+    Run a list statement and return `(data, total, next_cursor)`.
+
+    The page and its total come back in a single round trip; a separate count
+    is only issued when the requested page is empty.
+    """
+    page = page_statement(
+        statement,
+        keys,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=descending,
+        count=count,
+    )
+    rows = session.execute(page).all()
+    data, total, next_cursor = page_result(rows, keys, limit=limit, count=count)
+    if total is None and count != "none":
+        if not rows and not skip and cursor is None:
+            total = 0
+        else:
+            total = session.execute(count_statement(statement)).scalar_one()
+    return data, total, next_cursor
+
+
+async def fetch_page_async(
+    session: AsyncSession,
+    statement: Select[Any],
+    keys: Sequence[InstrumentedAttribute[Any]],
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    descending: bool = False,
+    count: CountMode = "exact",
+) -> tuple[list[Any], int | None, str | None]:
+    """
+    Async version of `fetch_page`.
+    """
+    page = page_statement(
+        statement,
+        keys,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=descending,
+        count=count,
+    )
+    rows = (await session.execute(page)).all()
+    data, total, next_cursor = page_result(rows, keys, limit=limit, count=count)
+    if total is None and count != "none":
+        if not rows and not skip and cursor is None:
+            total = 0
+        else:
+            total = (await session.execute(count_statement(statement))).scalar_one()
+    return data, total, next_cursor
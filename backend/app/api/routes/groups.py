@@ -1,80 +1,217 @@
-from typing import Any, Optional
+import datetime
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException, Query
-from sqlmodel import func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func
+from sqlmodel import col, delete, select
 
-from app.api.deps import CurrentUser, SessionDep
+from app import reports
+from app.api import loaders
+from app.api.batch import batch_ids, fetch_by_ids
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    ConditionalGet,
+    conditional_get,
+)
+from app.api.fieldsets import Fieldset, sparse_fieldset
+from app.api.pagination import CountMode, fetch_page_async
+from app.api.routing import TrustedJSONRoute
 from app.models import (
-    Group, GroupOut, GroupsOut, GroupCreate, GroupUpdate, Message, GroupStudentLink, Student
-    )
+    BatchGet,
+    Group,
+    GroupAttendance,
+    GroupCreate,
+    GroupOut,
+    GroupsOut,
+    GroupStudentLink,
+    GroupUpdate,
+    Lesson,
+    LessonStudentLink,
+    Message,
+    Student,
+)
+
+router = APIRouter(route_class=TrustedJSONRoute)
 
+GROUP_ORDER = (Group.id,)
 
-router = APIRouter()
+GroupFieldset = Annotated[
+    Fieldset, Depends(sparse_fieldset(Group, GroupOut, loaders.GROUP_INCLUDES))
+]
+GroupETag = Annotated[
+    ConditionalGet, Depends(conditional_get(loaders.GROUP_OUT_TABLES))
+]
 
 
 @router.get("/", response_model=GroupsOut)
-def read_groups(
-    session: SessionDep, 
-    current_user: CurrentUser,
-    skip: int = 0, 
+async def read_groups(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    etag: GroupETag,
+    fieldset: GroupFieldset,
+    skip: int = 0,
     limit: int = 100,
-    student_id: Optional[int] = Query(None, description="Student ID to filter by")
+    cursor: str | None = Query(
+        None, description="Cursor from a previous page, replaces skip"
+    ),
+    count: CountMode = Query("exact", description="How to compute the total count"),
+    student_id: int | None = Query(None, description="Student ID to filter by"),
+    ids: list[int] | None = Depends(batch_ids),
 ) -> Any:
     """
     Retrieve Groups.
     """
-    statement = select(Group).offset(skip).limit(limit)
-    count_statement = select(func.count()).select_from(Group)
+    await etag.check()
+    statement = select(Group).options(*fieldset.options(GROUP_ORDER))
     if student_id:
-        stud = session.get(Student, student_id)
+        stud = await session.get(Student, student_id)
         if not stud:
             raise HTTPException(status_code=404, detail="Student not found")
-        statement = statement.where(Group.student_links.any(GroupStudentLink.student_id == student_id))
-        count_statement = count_statement.where(Group.student_links.any(GroupStudentLink.student_id == student_id))
-    count = session.exec(count_statement).one()
-    groups = session.exec(statement).all()
-    return GroupsOut(data=groups, count=count)
+        statement = statement.where(
+            Group.student_links.any(GroupStudentLink.student_id == student_id)
+        )
+    if ids is not None:
+        groups = await fetch_by_ids(session, statement, Group.id, ids)
+        return fieldset.page(
+            GroupsOut, response, data=groups, count=len(groups), next_cursor=None
+        )
+    groups, total, next_cursor = await fetch_page_async(
+        session,
+        statement,
+        GROUP_ORDER,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count=count,
+    )
+    return fieldset.page(
+        GroupsOut, response, data=groups, count=total, next_cursor=next_cursor
+    )
+
+
+@router.post("/batch-get", response_model=GroupsOut)
+async def batch_get_groups(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    fieldset: GroupFieldset,
+    batch: BatchGet,
+) -> Any:
+    """
+    Get groups by ID, in the order of the request. Unknown ids are skipped.
+    """
+    statement = select(Group).options(*fieldset.options())
+    groups = await fetch_by_ids(session, statement, Group.id, batch.ids)
+    return fieldset.page(
+        GroupsOut, response, data=groups, count=len(groups), next_cursor=None
+    )
 
 
 @router.get("/{id}", response_model=GroupOut)
-def read_group(
-    session: SessionDep, 
-    current_user: CurrentUser, 
-    id: int
+async def read_group(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, etag: GroupETag, id: int
 ) -> Any:
     """
     Get Group by ID.
     """
-    group = session.get(Group, id)
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    await etag.check()
+    group = await session.get(Group, id, options=loaders.GROUP_OUT)
     if not group:
         raise HTTPException(status_code=404, detail="Item not found")
+    return group
+
+
+@router.get(
+    "/{id}/attendance",
+    response_model=GroupAttendance,
+)
+async def read_group_attendance(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    etag: Annotated[
+        ConditionalGet, Depends(conditional_get(loaders.GROUP_ATTENDANCE_TABLES))
+    ],
+    id: int,
+    day_from: datetime.date | None = Query(
+        None, alias="from", description="First day to include"
+    ),
+    day_to: datetime.date | None = Query(
+        None, alias="to", description="Last day to include"
+    ),
+) -> Any:
+    """
+    Get the attendance sheet of a group: its current members and anyone who
+    attended, against its lessons between `from` and `to`.
+    """
     if not current_user.is_superuser:
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    return group
+    await etag.check()
+    group = await session.get(Group, id, options=loaders.GROUP_OUT)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    # Lessons with the ids of their assistants, in one aggregate query
+    assistants = func.array_agg(LessonStudentLink.student_id).filter(
+        col(LessonStudentLink.student_id).is_not(None)
+    )
+    statement = (
+        select(Lesson.id, Lesson.day, assistants)
+        .outerjoin(LessonStudentLink, LessonStudentLink.lesson_id == Lesson.id)
+        .where(Lesson.group_id == id)
+        .group_by(Lesson.id)
+        .order_by(Lesson.day, Lesson.id)
+    )
+    if day_from:
+        statement = statement.where(Lesson.day >= day_from)
+    if day_to:
+        statement = statement.where(Lesson.day <= day_to)
+    lessons = (await session.exec(statement)).all()
+
+    students = {link.student_id for link in group.student_links}
+    for _, _, lesson_assistants in lessons:
+        students.update(lesson_assistants or ())
+    student_ids = sorted(students)
+    rows = {student_id: ["0"] * len(lessons) for student_id in student_ids}
+    for index, (_, _, lesson_assistants) in enumerate(lessons):
+        for student_id in lesson_assistants or ():
+            rows[student_id][index] = "1"
+    return GroupAttendance(
+        group_id=id,
+        students=student_ids,
+        lessons=[lesson_id for lesson_id, _, _ in lessons],
+        days=[day for _, day, _ in lessons],
+        presence=["".join(rows[student_id]) for student_id in student_ids],
+    )
 
 
 @router.post("/", response_model=GroupOut)
-def create_group(
-    *, session: SessionDep, group_in: GroupCreate
-) -> Any:
+async def create_group(*, session: AsyncSessionDep, group_in: GroupCreate) -> Any:
     """
     Create new Group.
     """
     group = Group.model_validate(group_in)
     session.add(group)
-    session.commit()
-    session.refresh(group)
-    return group
+    await session.commit()
+    return await session.get(
+        Group, group.id, options=loaders.GROUP_OUT, populate_existing=True
+    )
 
 
 @router.put("/{id}", response_model=GroupOut)
-def update_group(
-    *, session: SessionDep, current_user: CurrentUser, id: int, group_in: GroupUpdate
+async def update_group(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    id: int,
+    group_in: GroupUpdate,
 ) -> Any:
     """
     Update a group.
     """
-    group = session.get(Group, id)
+    group = await session.get(Group, id, options=loaders.GROUP_OUT)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     if not current_user.is_superuser:
@@ -82,21 +219,39 @@ def update_group(
     update_dict = group_in.model_dump(exclude_unset=True)
     group.sqlmodel_update(update_dict)
     session.add(group)
-    session.commit()
-    session.refresh(group)
+    await session.commit()
     return group
 
 
 @router.delete("/{id}")
-def delete_group(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+async def delete_group(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, id: int
+) -> Message:
     """
     Delete an Group.
     """
-    stud = session.get(Group, id)
+    stud = await session.get(Group, id)
     if not stud:
         raise HTTPException(status_code=404, detail="Group not found")
     if not current_user.is_superuser:
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(stud)
-    session.commit()
+    try:
+        # Delete Lessons, and their attendance from the balances
+        lessons = select(Lesson.id).where(Lesson.group_id == id)
+        await reports.account_attendance(session, Lesson.group_id == id, sign=-1)
+        await session.exec(
+            delete(LessonStudentLink).where(
+                col(LessonStudentLink.lesson_id).in_(lessons)
+            )
+        )
+        await session.exec(delete(Lesson).where(col(Lesson.group_id) == id))
+        # Delete GroupLinks
+        await session.exec(
+            delete(GroupStudentLink).where(col(GroupStudentLink.group_id) == id)
+        )
+        # Payments keep their group_id, the revenue rollup is left as is
+        await session.delete(stud)
+        await session.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occured: {e}")
     return Message(message="Item deleted successfully")
@@ -1,133 +1,313 @@
-from typing import Any, Optional
+import datetime
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException, Query
-from sqlmodel import func, select
-from sqlmodel.sql.expression import desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import Date, column, literal, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Lesson, LessonCreate, LessonUpdate, LessonOut, LessonsOut, Student, Group, Message, GroupStudentLink
+from app import reports
+from app.api import loaders
+from app.api.batch import batch_ids, fetch_by_ids
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    ConditionalGet,
+    conditional_get,
+)
+from app.api.fieldsets import Fieldset, sparse_fieldset
+from app.api.pagination import CountMode, fetch_page_async
+from app.api.routing import TrustedJSONRoute
+from app.models import (
+    BatchGet,
+    Group,
+    GroupStudentLink,
+    Lesson,
+    LessonCreate,
+    LessonOut,
+    LessonsGenerate,
+    LessonsOut,
+    LessonStudentLink,
+    LessonUpdate,
+    Message,
+    Student,
+)
 
-router = APIRouter()
+router = APIRouter(route_class=TrustedJSONRoute)
+
+# Most recent lessons first
+LESSON_ORDER = (Lesson.day, Lesson.id)
+
+LessonFieldset = Annotated[
+    Fieldset, Depends(sparse_fieldset(Lesson, LessonOut, loaders.LESSON_INCLUDES))
+]
+LessonETag = Annotated[
+    ConditionalGet, Depends(conditional_get(loaders.LESSON_OUT_TABLES))
+]
 
 
 @router.get("/", response_model=LessonsOut)
-def read_lessons(
-        session: SessionDep, 
-        current_user: CurrentUser,
-        skip: int = 0, 
-        limit: int = 100, 
-        student_id: Optional[int] = Query(None, description="Student ID to filter by"), 
-        group_id: Optional[int] = Query(None, description="Group ID to filter by")
-    ) -> Any:
-    """
-    Retrieve lessons.
-    """
-    count_statement = select(func.count()).select_from(Lesson)
-    statement = select(Lesson).order_by(desc(Lesson.day)).offset(skip).limit(limit)
+async def read_lessons(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    etag: LessonETag,
+    fieldset: LessonFieldset,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = Query(
+        None, description="Cursor from a previous page, replaces skip"
+    ),
+    count: CountMode = Query("exact", description="How to compute the total count"),
+    student_id: int | None = Query(None, description="Student ID to filter by"),
+    group_id: int | None = Query(None, description="Group ID to filter by"),
+    day_from: datetime.date | None = Query(None, description="First day to include"),
+    day_to: datetime.date | None = Query(None, description="Last day to include"),
+    ids: list[int] | None = Depends(batch_ids),
+) -> Any:
+    """
+    Retrieve lessons, most recent first (by day, then by id).
+    """
+    await etag.check()
+    statement = select(Lesson).options(*fieldset.options(LESSON_ORDER))
     # Filter by student
     if student_id:
-        student = session.get(Student, student_id)
+        student = await session.get(Student, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         statement = statement.where(Lesson.assistants.any(Student.id == student_id))
-        count_statement = count_statement.where(Lesson.assistants.any(Student.id == student_id))
     # Filter by group
     if group_id:
-        group = session.get(Group, group_id)
+        group = await session.get(Group, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="Group not found")
         statement = statement.where(Lesson.group_id == group_id)
-        count_statement = count_statement.where(Lesson.group_id == group_id)
-    count = session.exec(count_statement).one()
-    lessons = session.exec(statement).all()
-    return LessonsOut(data=lessons, count=count)
+    # Filter by date range
+    if day_from:
+        statement = statement.where(Lesson.day >= day_from)
+    if day_to:
+        statement = statement.where(Lesson.day <= day_to)
+    if ids is not None:
+        lessons = await fetch_by_ids(session, statement, Lesson.id, ids)
+        return fieldset.page(
+            LessonsOut, response, data=lessons, count=len(lessons), next_cursor=None
+        )
+    lessons, total, next_cursor = await fetch_page_async(
+        session,
+        statement,
+        LESSON_ORDER,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+        count=count,
+    )
+    return fieldset.page(
+        LessonsOut, response, data=lessons, count=total, next_cursor=next_cursor
+    )
+
+
+@router.post("/batch-get", response_model=LessonsOut)
+async def batch_get_lessons(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    fieldset: LessonFieldset,
+    batch: BatchGet,
+) -> Any:
+    """
+    Get lessons by ID, in the order of the request. Unknown ids are skipped.
+    """
+    statement = select(Lesson).options(*fieldset.options())
+    lessons = await fetch_by_ids(session, statement, Lesson.id, batch.ids)
+    return fieldset.page(
+        LessonsOut, response, data=lessons, count=len(lessons), next_cursor=None
+    )
 
 
 @router.get("/{id}", response_model=LessonOut)
-def read_lesson(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+async def read_lesson(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, etag: LessonETag, id: int
+) -> Any:
     """
     Get lesson by ID.
     """
-    lesson = session.get(Lesson, id)
+    await etag.check()
+    lesson = await session.get(Lesson, id, options=loaders.LESSON_OUT)
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
     count_assistants = len(lesson.assistants)
-    return LessonOut(day=lesson.day, assistants=lesson.assistants, assistants_count=count_assistants, group=lesson.group, id=lesson.id)
+    return LessonOut(
+        day=lesson.day,
+        assistants=lesson.assistants,
+        assistants_count=count_assistants,
+        group=lesson.group,
+        id=lesson.id,
+    )
+
+
+async def _get_group_assistants(
+    session: AsyncSession, group_id: int, assistants_ids: list[int]
+) -> list[Student]:
+    """
+    Students `assistants_ids` of the group, in the same order. Answers 404
+    when one of them is not a member.
+    """
+    statement = (
+        select(Student)
+        .join(GroupStudentLink, GroupStudentLink.student_id == Student.id)
+        .where(
+            GroupStudentLink.group_id == group_id, col(Student.id).in_(assistants_ids)
+        )
+    )
+    students = {
+        student.id: student for student in (await session.exec(statement)).all()
+    }
+    for aid in assistants_ids:
+        if aid not in students:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Student {aid} is not registered in course {group_id}",
+            )
+    return [students[aid] for aid in dict.fromkeys(assistants_ids)]
 
 
 @router.post("/", response_model=LessonOut)
-def create_lesson(
-    *, 
-    session: SessionDep,
-    current_user: CurrentUser,
-    lesson_in: LessonCreate
+async def create_lesson(
+    *, session: AsyncSessionDep, current_user: AsyncCurrentUser, lesson_in: LessonCreate
 ) -> Any:
     """
     Create new lesson.
     """
     assistants_ids = lesson_in.model_dump().pop("assistants", [])
-    students_list = []
-    group = session.get(Group, lesson_in.group_id)
-    if session.exec(select(Lesson).where(Lesson.day == lesson_in.day, Lesson.group_id == lesson_in.group_id)).all():
+    group = await session.get(Group, lesson_in.group_id)
+    if (
+        await session.exec(
+            select(Lesson).where(
+                Lesson.day == lesson_in.day, Lesson.group_id == lesson_in.group_id
+            )
+        )
+    ).all():
         raise HTTPException(status_code=400, detail="Lesson already exists")
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-    for aid in assistants_ids:
-        link = session.exec(select(GroupStudentLink).where(GroupStudentLink.group_id == group.id, GroupStudentLink.student_id == aid))
-        stud = session.get(Student, aid)
-        if not link:
-            raise HTTPException(status_code=404, detail=f"Student {aid} is not registered in course {lesson.group_id}")
-        students_list.append(stud)
+    students_list = await _get_group_assistants(session, group.id, assistants_ids)
     # Create lesson
     lesson = Lesson(day=lesson_in.day, group=group, assistants=students_list)
     session.add(lesson)
-    session.commit()
-    session.refresh(lesson)
-    return lesson
+    await session.flush()
+    await reports.account_attendance(session, LessonStudentLink.lesson_id == lesson.id)
+    await session.commit()
+    return await session.get(
+        Lesson, lesson.id, options=loaders.LESSON_OUT, populate_existing=True
+    )
+
+
+@router.post("/generate", response_model=LessonsOut)
+async def generate_lessons(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    lessons_in: LessonsGenerate,
+) -> Any:
+    """
+    Create a group's missing lessons on some weekdays of a date range.
+
+    Days that already have a lesson for the group are skipped. With
+    `with_assistants` every current member of the group is registered as an
+    assistant of the new lessons.
+    """
+    group = await session.get(Group, lessons_in.group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    days = [
+        lessons_in.day_from + datetime.timedelta(days=offset)
+        for offset in range((lessons_in.day_to - lessons_in.day_from).days + 1)
+    ]
+    days = [day for day in days if day.weekday() in lessons_in.weekdays]
+    if not days:
+        return LessonsOut(data=[], count=0)
+    # Insert every day that has no lesson yet in a single statement. Days
+    # taken meanwhile by a concurrent request are skipped by the unique
+    # (group_id, day) index, only the lessons inserted here are returned.
+    candidate_days = values(column("day", Date), name="candidate_days").data(
+        [(day,) for day in days]
+    )
+    statement = (
+        insert(Lesson)
+        .from_select(
+            ["day", "group_id"], select(candidate_days.c.day, literal(group.id))
+        )
+        .on_conflict_do_nothing(index_elements=["group_id", "day"])
+        .returning(Lesson.id)
+    )
+    created = list((await session.exec(statement)).scalars())
+    if created and lessons_in.with_assistants:
+        members = select(Lesson.id, GroupStudentLink.student_id).where(
+            col(Lesson.id).in_(created), GroupStudentLink.group_id == group.id
+        )
+        await session.exec(
+            insert(LessonStudentLink).from_select(["lesson_id", "student_id"], members)
+        )
+        await reports.account_attendance(
+            session, col(LessonStudentLink.lesson_id).in_(created)
+        )
+    await session.commit()
+    statement = (
+        select(Lesson)
+        .options(*loaders.LESSON_OUT)
+        .where(col(Lesson.id).in_(created))
+        .order_by(Lesson.day)
+    )
+    lessons = (await session.exec(statement)).all() if created else []
+    return LessonsOut(data=lessons, count=len(lessons))
 
 
 @router.put("/{id}", response_model=LessonOut)
-def update_lesson(
-    *, 
-    session: SessionDep, 
-    current_user: CurrentUser, 
-    id: int, 
-    lesson_in: LessonUpdate
+async def update_lesson(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    id: int,
+    lesson_in: LessonUpdate,
 ) -> Any:
     """
     Update an existing lesson.
     """
-    lesson = session.get(Lesson, id)
+    lesson = await session.get(Lesson, id, options=loaders.LESSON_OUT)
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    students_list = []
-    for aid in lesson_in.assistants:
-        stud = session.get(Student, aid)
-        if not stud:
-            raise HTTPException(status_code=404, detail=f"Student {aid} not found")
-        link = session.exec(select(GroupStudentLink).where(GroupStudentLink.group_id == lesson.group.id, GroupStudentLink.student_id == aid))
-        if not link:
-            raise HTTPException(status_code=404, detail=f"Student {aid} is not registered in course {lesson.group_id}")
-        students_list.append(stud)
+    students_list = await _get_group_assistants(
+        session, lesson.group_id, lesson_in.assistants
+    )
+    await reports.account_attendance(
+        session, LessonStudentLink.lesson_id == id, sign=-1
+    )
     lesson.assistants = students_list
     lesson.day = lesson_in.day
     session.add(lesson)
-    session.commit()
-    session.refresh(lesson)
-    return lesson
+    await session.flush()
+    await reports.account_attendance(session, LessonStudentLink.lesson_id == id)
+    await session.commit()
+    return await session.get(
+        Lesson, id, options=loaders.LESSON_OUT, populate_existing=True
+    )
 
 
 @router.delete("/{id}")
-def delete_lesson(
-    session: SessionDep, 
-    current_user: CurrentUser,
-    id: int) -> Message:
+async def delete_lesson(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, id: int
+) -> Message:
     """
     Delete a lesson.
     """
-    lesson = session.get(Lesson, id)
+    lesson = await session.get(Lesson, id)
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    session.delete(lesson)
-    session.commit()
+    await reports.account_attendance(
+        session, LessonStudentLink.lesson_id == id, sign=-1
+    )
+    await session.delete(lesson)
+    await session.commit()
     return Message(message="Lesson deleted successfully")
@@ -6,9 +6,17 @@ from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    AsyncSessionDep,
+    ClientIP,
+    CurrentUser,
+    SessionDep,
+    get_current_active_superuser,
+)
 from app.core import security
+from app.core.cache import user_cache
 from app.core.config import settings
+from app.core.ratelimit import check_login_rate
 from app.core.security import get_password_hash
 from app.models import Message, NewPassword, Token, UserOut
 from app.utils import (
@@ -21,16 +29,43 @@ from app.utils import (
 router = APIRouter()
 
 
-@router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+def _too_many_requests(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many attempts, try again later",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def limit_login(
+    client_ip: ClientIP, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> None:
+    if retry_after := await check_login_rate("login", client_ip, form_data.username):
+        raise _too_many_requests(retry_after)
+
+
+async def limit_password_recovery(client_ip: ClientIP, email: str) -> None:
+    if retry_after := await check_login_rate("password-recovery", client_ip, email):
+        raise _too_many_requests(retry_after)
+
+
+@router.post("/login/access-token", dependencies=[Depends(limit_login)])
+async def login_access_token(
+    session: AsyncSessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
-        session=session, email=form_data.username, password=form_data.password
-    )
+    try:
+        user = await crud.authenticate_async(
+            session=session, email=form_data.username, password=form_data.password
+        )
+    except security.PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
@@ -51,7 +86,9 @@ def test_token(current_user: CurrentUser) -> Any:
     return current_user
 
 
-@router.post("/password-recovery/{email}")
+@router.post(
+    "/password-recovery/{email}", dependencies=[Depends(limit_password_recovery)]
+)
 def recover_password(email: str, session: SessionDep) -> Message:
     """
     Password Recovery
@@ -95,6 +132,7 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     user.hashed_password = hashed_password
     session.add(user)
     session.commit()
+    user_cache.invalidate(user.id)
     return Message(message="Password updated successfully")
 
 
@@ -1,91 +1,366 @@
-from typing import Any, Optional
+import csv
+import datetime
+import io
+import json
+from collections.abc import AsyncIterator
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, HTTPException, Query
-from sqlmodel import func, select
-from sqlmodel.sql.expression import desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import ColumnElement, Select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Student, Payment, PaymentsOut, PaymentOut, PaymentCreate, PaymentUpdate, Message
+from app import reports
+from app.api import loaders
+from app.api.batch import batch_ids, fetch_by_ids
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    ConditionalGet,
+    conditional_get,
+)
+from app.api.fieldsets import Fieldset, sparse_fieldset
+from app.api.pagination import CountMode, fetch_page_async
+from app.api.routing import TrustedJSONRoute
+from app.core.db import async_engine
+from app.models import (
+    BatchGet,
+    Message,
+    Payment,
+    PaymentCreate,
+    PaymentOut,
+    PaymentRollup,
+    PaymentsOut,
+    PaymentsSummary,
+    PaymentUpdate,
+    Student,
+)
 
-router = APIRouter()
+router = APIRouter(route_class=TrustedJSONRoute)
+
+# Most recent payments first
+PAYMENT_ORDER = (Payment.day, Payment.id)
+
+PaymentFieldset = Annotated[
+    Fieldset, Depends(sparse_fieldset(Payment, PaymentOut, loaders.PAYMENT_INCLUDES))
+]
+PaymentETag = Annotated[
+    ConditionalGet, Depends(conditional_get(loaders.PAYMENT_OUT_TABLES))
+]
+
+ExportFormat = Literal["csv", "ndjson"]
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_COLUMNS = (
+    Payment.id,
+    Payment.day,
+    Payment.student_id,
+    Student.full_name.label("student_full_name"),
+    Payment.group_id,
+    Payment.amount,
+    Payment.method,
+    Payment.reason,
+    Payment.notes,
+    Payment.created_at,
+)
+# Rows fetched from the server side cursor at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def _payment_filters(
+    day_from: datetime.date | None,
+    day_to: datetime.date | None,
+    method: str | None,
+    reason: str | None,
+    amount_min: int | None,
+    amount_max: int | None,
+) -> list[ColumnElement[bool]]:
+    criteria = []
+    if day_from:
+        criteria.append(Payment.day >= day_from)
+    if day_to:
+        criteria.append(Payment.day <= day_to)
+    if method:
+        criteria.append(Payment.method == method)
+    if reason:
+        criteria.append(Payment.reason == reason)
+    if amount_min is not None:
+        criteria.append(Payment.amount >= amount_min)
+    if amount_max is not None:
+        criteria.append(Payment.amount <= amount_max)
+    return criteria
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(value)
+
+
+async def _export_payments(
+    statement: Select[Any], format: ExportFormat
+) -> AsyncIterator[str]:
+    """
+    Stream the rows of `statement` one cursor batch at a time. The export
+    has its own session: the request one is closed before the response is
+    sent.
+    """
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream(
+            statement.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == "csv":
+            writer.writerow(result.keys())
+        async for rows in result.partitions():
+            for row in rows:
+                if format == "csv":
+                    writer.writerow(row)
+                else:
+                    buffer.write(
+                        json.dumps(row._asdict(), default=_json_default) + "\n"
+                    )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
 
 
 @router.get("/", response_model=PaymentsOut)
-def read_payments(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100, student_id: Optional[int] = Query(None, description="Student ID to filter by")
+async def read_payments(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    etag: PaymentETag,
+    fieldset: PaymentFieldset,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = Query(
+        None, description="Cursor from a previous page, replaces skip"
+    ),
+    count: CountMode = Query("exact", description="How to compute the total count"),
+    student_id: int | None = Query(None, description="Student ID to filter by"),
+    day_from: datetime.date | None = Query(None, description="First day to include"),
+    day_to: datetime.date | None = Query(None, description="Last day to include"),
+    method: str | None = Query(None, description="Payment method to filter by"),
+    reason: str | None = Query(None, description="Payment reason to filter by"),
+    amount_min: int | None = Query(None, description="Smallest amount to include"),
+    amount_max: int | None = Query(None, description="Largest amount to include"),
+    ids: list[int] | None = Depends(batch_ids),
 ) -> Any:
     """
-    Retrieve payments.
+    Retrieve payments, most recent first (by day, then by id).
     """
-    count_statement = select(func.count()).select_from(Payment)
-    statement = select(Payment).offset(skip).limit(limit)
+    await etag.check()
+    statement = select(Payment).options(*fieldset.options(PAYMENT_ORDER))
     if student_id:
-        student = session.get(Student, student_id)
+        student = await session.get(Student, student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         statement = statement.where(Payment.student_id == student_id)
-        count_statement = count_statement.where(Payment.student_id == student_id)
-    count = session.exec(count_statement).one()
-    payments = session.exec(statement).all()
-    return PaymentsOut(data=payments, count=count)
+    statement = statement.where(
+        *_payment_filters(day_from, day_to, method, reason, amount_min, amount_max)
+    )
+    if ids is not None:
+        payments = await fetch_by_ids(session, statement, Payment.id, ids)
+        return fieldset.page(
+            PaymentsOut, response, data=payments, count=len(payments), next_cursor=None
+        )
+    payments, total, next_cursor = await fetch_page_async(
+        session,
+        statement,
+        PAYMENT_ORDER,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        descending=True,
+        count=count,
+    )
+    return fieldset.page(
+        PaymentsOut, response, data=payments, count=total, next_cursor=next_cursor
+    )
+
+
+@router.post("/batch-get", response_model=PaymentsOut)
+async def batch_get_payments(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    fieldset: PaymentFieldset,
+    batch: BatchGet,
+) -> Any:
+    """
+    Get payments by ID, in the order of the request. Unknown ids are skipped.
+    """
+    statement = select(Payment).options(*fieldset.options())
+    payments = await fetch_by_ids(session, statement, Payment.id, batch.ids)
+    return fieldset.page(
+        PaymentsOut, response, data=payments, count=len(payments), next_cursor=None
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}
+    },
+)
+async def export_payments(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    format: ExportFormat = Query("csv", description="Export file format"),
+    day_from: datetime.date | None = Query(None, description="First day to include"),
+    day_to: datetime.date | None = Query(None, description="Last day to include"),
+    student_id: int | None = Query(None, description="Student ID to filter by"),
+    method: str | None = Query(None, description="Payment method to filter by"),
+    reason: str | None = Query(None, description="Payment reason to filter by"),
+    amount_min: int | None = Query(None, description="Smallest amount to include"),
+    amount_max: int | None = Query(None, description="Largest amount to include"),
+) -> Any:
+    """
+    Export payments, oldest first, as CSV or NDJSON streamed from a server
+    side cursor.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    statement = select(*EXPORT_COLUMNS).join(Student, Student.id == Payment.student_id)
+    if student_id:
+        statement = statement.where(Payment.student_id == student_id)
+    statement = statement.where(
+        *_payment_filters(day_from, day_to, method, reason, amount_min, amount_max)
+    )
+    statement = statement.order_by(Payment.day, Payment.id)
+    return StreamingResponse(
+        _export_payments(statement, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="payments.{format}"'},
+    )
+
+
+@router.get("/summary", response_model=PaymentsSummary)
+async def read_payments_summary(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    month_from: datetime.date | None = Query(
+        None, description="First month to include"
+    ),
+    month_to: datetime.date | None = Query(None, description="Last month to include"),
+    group_id: int | None = Query(None, description="Group ID to filter by"),
+    method: str | None = Query(None, description="Payment method to filter by"),
+    reason: str | None = Query(None, description="Payment reason to filter by"),
+) -> Any:
+    """
+    Revenue per month, group, method and reason, read from the payments rollup.
+    """
+    statement = select(PaymentRollup).where(PaymentRollup.payments != 0)
+    if month_from:
+        statement = statement.where(PaymentRollup.month >= month_from.replace(day=1))
+    if month_to:
+        statement = statement.where(PaymentRollup.month <= month_to.replace(day=1))
+    if group_id:
+        statement = statement.where(PaymentRollup.group_id == group_id)
+    if method:
+        statement = statement.where(PaymentRollup.method == method)
+    if reason:
+        statement = statement.where(PaymentRollup.reason == reason)
+    statement = statement.order_by(
+        PaymentRollup.month,
+        PaymentRollup.group_id,
+        PaymentRollup.method,
+        PaymentRollup.reason,
+    )
+    rows = (await session.exec(statement)).all()
+    return PaymentsSummary(
+        data=rows,
+        amount=sum(row.amount for row in rows),
+        payments=sum(row.payments for row in rows),
+    )
 
 
 @router.get("/{id}", response_model=PaymentOut)
-def read_payment(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+async def read_payment(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, etag: PaymentETag, id: int
+) -> Any:
     """
     Get student by ID.
     """
-    payment = session.get(Payment, id)
-    if not payment:
-        raise HTTPException(status_code=404, detail="Payment not found")
     if not current_user.is_superuser:
         raise HTTPException(status_code=400, detail="Not enough permissions")
+    await etag.check()
+    payment = await session.get(Payment, id, options=loaders.PAYMENT_OUT)
+    if not payment:
+        raise HTTPException(status_code=404, detail="Payment not found")
     return payment
 
 
 @router.post("/", response_model=PaymentOut)
-def create_payment(
-    *, session: SessionDep, current_user: CurrentUser, payment_in: PaymentCreate
+async def create_payment(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    payment_in: PaymentCreate,
 ) -> Any:
     """
     Create new payment.
     """
     payment = Payment.model_validate(payment_in)
+    payment.group_id = await reports.get_payment_group_id(session, payment.student_id)
     session.add(payment)
-    session.commit()
-    session.refresh(payment)
-    return payment
+    await session.flush()
+    await reports.account_payments(session, Payment.id == payment.id)
+    await session.commit()
+    return await session.get(
+        Payment, payment.id, options=loaders.PAYMENT_OUT, populate_existing=True
+    )
 
 
 @router.put("/{id}", response_model=PaymentOut)
-def update_payment(
-    *, session: SessionDep, current_user: CurrentUser, id: int, payment_in: PaymentUpdate
+async def update_payment(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    id: int,
+    payment_in: PaymentUpdate,
 ) -> Any:
     """
     Update a payment.
     """
-    payment = session.get(Payment, id)
+    payment = await session.get(Payment, id, options=loaders.PAYMENT_OUT)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
+    await reports.account_payments(session, Payment.id == id, sign=-1)
+    student_id = payment.student_id
     update_dict = payment_in.model_dump(exclude_unset=True)
     payment.sqlmodel_update(update_dict)
+    if payment.student_id != student_id:
+        payment.group_id = await reports.get_payment_group_id(
+            session, payment.student_id
+        )
     session.add(payment)
-    session.commit()
-    session.refresh(payment)
-    return payment
+    await session.flush()
+    await reports.account_payments(session, Payment.id == id)
+    await session.commit()
+    return await session.get(
+        Payment, id, options=loaders.PAYMENT_OUT, populate_existing=True
+    )
 
 
 @router.delete("/{id}")
-def delete_payment(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+async def delete_payment(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, id: int
+) -> Message:
     """
     Delete a payment.
     """
-    payment = session.get(Payment, id)
+    payment = await session.get(Payment, id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     try:
-        session.delete(payment)
-        session.commit()
+        await reports.account_payments(session, Payment.id == id, sign=-1)
+        await session.delete(payment)
+        await session.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occured: {e}")
     return Message(message="Payment deleted successfully")
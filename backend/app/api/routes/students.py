@@ -1,92 +1,410 @@
-import copy
+import csv
+import datetime
+import io
+import json
+from collections.abc import Iterator
+from typing import Annotated, Any, Literal
 
-from typing import Any, Optional
-
-from fastapi import APIRouter, HTTPException, Query
-from sqlmodel import func, select, delete, col
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import func, insert, literal_column, or_
+from sqlmodel import col, delete, select
 from sqlmodel.sql.expression import desc
+from starlette.concurrency import run_in_threadpool
 
-from app.api.deps import CurrentUser, SessionDep
+from app import reports
+from app.api import loaders
+from app.api.batch import batch_ids, fetch_by_ids
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    ConditionalGet,
+    conditional_get,
+)
+from app.api.fieldsets import Fieldset, sparse_fieldset
+from app.api.pagination import CountMode, fetch_page_async
+from app.api.routing import TrustedJSONRoute
+from app.core.config import settings
 from app.models import (
-    Group, GroupStudentLink, Payment, Student, StudentOut, StudentsOut, StudentCreate, StudentUpdate, Message
-    )
+    STUDENT_SEARCH_DOCUMENT,
+    BatchGet,
+    Group,
+    GroupStudentLink,
+    Message,
+    Payment,
+    Student,
+    StudentBalance,
+    StudentBalancesOut,
+    StudentCreate,
+    StudentImport,
+    StudentImportError,
+    StudentOut,
+    StudentsImportOut,
+    StudentsOut,
+    StudentUpdate,
+)
+
+router = APIRouter(route_class=TrustedJSONRoute)
+
+STUDENT_ORDER = (Student.id,)
+
+StudentFieldset = Annotated[
+    Fieldset, Depends(sparse_fieldset(Student, StudentOut, loaders.STUDENT_INCLUDES))
+]
+StudentETag = Annotated[
+    ConditionalGet, Depends(conditional_get(loaders.STUDENT_OUT_TABLES))
+]
+
+ImportFormat = Literal["csv", "ndjson"]
+# Students inserted per statement by imports
+IMPORT_BATCH_SIZE = 1000
+
+
+def _import_format(file: UploadFile) -> ImportFormat:
+    filename = (file.filename or "").lower()
+    if file.content_type in (
+        "application/x-ndjson",
+        "application/jsonl",
+    ) or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def _error_messages(e: ValidationError) -> list[str]:
+    return [
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in e.errors()
+    ]
+
+
+def _parse_import(
+    file: UploadFile, format: ImportFormat
+) -> Iterator[tuple[int, StudentImport | list[str]]]:
+    """
+    Read an upload line by line, yielding each row's line number with either
+    the validated row or its error messages.
+    """
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        if format == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                # Empty cells are missing values, not empty strings
+                data = {key: value or None for key, value in row.items() if key}
+                try:
+                    yield reader.line_num, StudentImport.model_validate(data)
+                except ValidationError as e:
+                    yield reader.line_num, _error_messages(e)
+        else:
+            for line_num, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_num, StudentImport.model_validate(json.loads(line))
+                except ValidationError as e:
+                    yield line_num, _error_messages(e)
+                except ValueError:
+                    yield line_num, ["Invalid JSON"]
+    finally:
+        text.detach()
+
 
-router = APIRouter()
+def _read_import(
+    file: UploadFile, format: ImportFormat
+) -> tuple[list[tuple[int, StudentImport]], list[StudentImportError]]:
+    """
+    Parse a whole upload, blocking: run it in the threadpool. Stops with a
+    413 past STUDENT_IMPORT_MAX_ROWS rows.
+    """
+    rows: list[tuple[int, StudentImport]] = []
+    errors: list[StudentImportError] = []
+    for count, (line_num, row) in enumerate(_parse_import(file, format), start=1):
+        if count > settings.STUDENT_IMPORT_MAX_ROWS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Imports are limited to {settings.STUDENT_IMPORT_MAX_ROWS} rows",
+            )
+        if isinstance(row, StudentImport):
+            rows.append((line_num, row))
+        else:
+            errors.append(StudentImportError(row=line_num, errors=row))
+    return rows, errors
 
 
 @router.get("/", response_model=StudentsOut)
-def read_students(
-    session: SessionDep,
-    current_user: CurrentUser,
-    skip: int = 0, 
-    limit: int = 100, 
-    group_id: Optional[int] = Query(None, description="Group ID to filter by")
+async def read_students(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    etag: StudentETag,
+    fieldset: StudentFieldset,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = Query(
+        None, description="Cursor from a previous page, replaces skip"
+    ),
+    count: CountMode = Query("exact", description="How to compute the total count"),
+    group_id: int | None = Query(None, description="Group ID to filter by"),
+    ids: list[int] | None = Depends(batch_ids),
 ) -> Any:
     """
     Retrieve students.
     """
-    statement = select(Student).offset(skip).limit(limit)
-    count_statement = select(func.count()).select_from(Student)
+    await etag.check()
+    statement = select(Student).options(*fieldset.options(STUDENT_ORDER))
     if group_id:
-        group = session.get(Group, group_id)
+        group = await session.get(Group, group_id)
         if not group:
             raise HTTPException(status_code=404, detail="Group not found")
-        statement = statement.where(Student.group_links.any(GroupStudentLink.group_id == group_id))
-        count_statement = count_statement.where(Student.group_links.any(GroupStudentLink.group_id == group_id))
-    count = session.exec(count_statement).one()
-    students = session.exec(statement).all()
-    return StudentsOut(data=students, count=count)
+        statement = statement.where(
+            Student.group_links.any(GroupStudentLink.group_id == group_id)
+        )
+    if ids is not None:
+        students = await fetch_by_ids(session, statement, Student.id, ids)
+        return fieldset.page(
+            StudentsOut, response, data=students, count=len(students), next_cursor=None
+        )
+    students, total, next_cursor = await fetch_page_async(
+        session,
+        statement,
+        STUDENT_ORDER,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count=count,
+    )
+    return fieldset.page(
+        StudentsOut, response, data=students, count=total, next_cursor=next_cursor
+    )
+
+
+@router.post("/batch-get", response_model=StudentsOut)
+async def batch_get_students(
+    session: AsyncSessionDep,
+    response: Response,
+    current_user: AsyncCurrentUser,
+    fieldset: StudentFieldset,
+    batch: BatchGet,
+) -> Any:
+    """
+    Get students by ID, in the order of the request. Unknown ids are skipped.
+    """
+    statement = select(Student).options(*fieldset.options())
+    students = await fetch_by_ids(session, statement, Student.id, batch.ids)
+    return fieldset.page(
+        StudentsOut, response, data=students, count=len(students), next_cursor=None
+    )
+
+
+@router.post("/import", response_model=StudentsImportOut)
+async def import_students(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    file: UploadFile,
+    format: ImportFormat | None = Query(
+        None, description="csv or ndjson, guessed from the file when omitted"
+    ),
+) -> Any:
+    """
+    Bulk import students from a CSV or NDJSON file.
+
+    Rows are validated like StudentCreate, with `groups` as a list of group
+    ids ("1;2" in CSV). Invalid rows and rows referring to unknown groups are
+    reported and skipped; the rest are created in a single transaction.
+    Files over STUDENT_IMPORT_MAX_BYTES or STUDENT_IMPORT_MAX_ROWS are
+    rejected.
+    """
+    if file.size is not None and file.size > settings.STUDENT_IMPORT_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Imports are limited to {settings.STUDENT_IMPORT_MAX_BYTES} bytes",
+        )
+    rows, errors = await run_in_threadpool(
+        _read_import, file, format or _import_format(file)
+    )
+    # Resolve all referenced groups at once
+    group_ids = {group_id for _, row in rows for group_id in row.groups}
+    known_group_ids = set()
+    if group_ids:
+        known_group_ids = set(
+            (
+                await session.exec(select(Group.id).where(col(Group.id).in_(group_ids)))
+            ).all()
+        )
+    valid_rows = []
+    for line_num, row in rows:
+        unknown = sorted(set(row.groups) - known_group_ids)
+        if unknown:
+            errors.append(
+                StudentImportError(
+                    row=line_num,
+                    errors=[
+                        f"groups: Group {group_id} not found" for group_id in unknown
+                    ],
+                )
+            )
+        else:
+            valid_rows.append(row)
+    created: list[int] = []
+    now = datetime.datetime.now()
+    students_statement = insert(Student).returning(
+        Student.id, sort_by_parameter_order=True
+    )
+    for start in range(0, len(valid_rows), IMPORT_BATCH_SIZE):
+        batch = valid_rows[start : start + IMPORT_BATCH_SIZE]
+        students_params = [
+            {**row.model_dump(exclude={"groups"}), "created_at": now} for row in batch
+        ]
+        student_ids = list(
+            (await session.exec(students_statement, params=students_params)).scalars()
+        )
+        links_params = [
+            {"group_id": group_id, "student_id": student_id, "joined_at": now}
+            for student_id, row in zip(student_ids, batch, strict=True)
+            for group_id in set(row.groups)
+        ]
+        if links_params:
+            await session.exec(insert(GroupStudentLink), params=links_params)
+        created.extend(student_ids)
+    if created:
+        await session.commit()
+    errors.sort(key=lambda error: error.row)
+    return StudentsImportOut(created=created, errors=errors)
+
+
+@router.get("/balances", response_model=StudentBalancesOut)
+async def read_student_balances(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    group_id: int | None = Query(None, description="Group ID to filter by"),
+) -> Any:
+    """
+    Retrieve the students that owe money, largest debt first.
+    """
+    try:
+        statement = reports.student_balances_statement()
+    except reports.BalancesNotConfigured:
+        raise HTTPException(
+            status_code=503,
+            detail="Student balances are not configured, set LESSON_PRICE and MONTHLY_FEE",
+        )
+    if group_id:
+        group = await session.get(Group, group_id)
+        if not group:
+            raise HTTPException(status_code=404, detail="Group not found")
+        members = select(GroupStudentLink.student_id).where(
+            GroupStudentLink.group_id == group_id
+        )
+        statement = statement.where(col(StudentBalance.student_id).in_(members))
+    owed = statement.selected_columns.owed
+    statement = (
+        statement.having(owed > 0)
+        .add_columns(func.count().over().label("total"))
+        .order_by(desc(owed), StudentBalance.student_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    rows = (await session.exec(statement)).all()
+    return StudentBalancesOut(
+        data=[row._mapping for row in rows], count=rows[0].total if rows else 0
+    )
+
+
+@router.get("/search", response_model=StudentsOut)
+async def search_students(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    etag: StudentETag,
+    q: str = Query(
+        ..., min_length=2, description="Text to look for in names and cities"
+    ),
+    skip: int = 0,
+    limit: int = 100,
+) -> Any:
+    """
+    Search students by full name, city or responsible adult, best match first.
+
+    Words are matched by trigram similarity, so small typos are tolerated;
+    exact fragments anywhere in the text always match.
+    """
+    await etag.check()
+    document = literal_column(f"({STUDENT_SEARCH_DOCUMENT})")
+    fragment = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rank = func.word_similarity(q, document)
+    statement = (
+        select(Student, func.count().over().label("total"))
+        .options(*loaders.STUDENT_OUT)
+        # Both operators are served by ix_student_search_trgm
+        .where(or_(document.op("%>")(q), document.ilike(f"%{fragment}%")))
+        .order_by(desc(rank), Student.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    rows = (await session.exec(statement)).all()
+    return StudentsOut(
+        data=[row.Student for row in rows], count=rows[0].total if rows else 0
+    )
 
 
 @router.get("/{id}", response_model=StudentOut)
-def read_student(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+async def read_student(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, etag: StudentETag, id: int
+) -> Any:
     """
     Get student by ID.
     """
-    student = session.get(Student, id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
     if not current_user.is_superuser:
         raise HTTPException(status_code=400, detail="Not enough permissions")
+    await etag.check()
+    student = await session.get(Student, id, options=loaders.STUDENT_OUT)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
     return student
 
 
 @router.post("/", response_model=StudentOut)
-def create_student(
-    *, session: SessionDep, current_user: CurrentUser, student_in: StudentCreate
+async def create_student(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    student_in: StudentCreate,
 ) -> Any:
     """
     Create new student.
     """
     stud = Student.model_validate(student_in)
     session.add(stud)
-    session.commit()
+    await session.commit()
     # Retrieve groups from group_ids and establish relationships
     if student_in.groups:
-        groups_to_register = []
         for group_id in student_in.groups:
-            g = session.get(Group, group_id)
+            g = await session.get(Group, group_id)
             if not g:
-                raise HTTPException(status_code=404, detail=f"Group not found")
+                raise HTTPException(status_code=404, detail="Group not found")
             # Create relationships
             gsl = GroupStudentLink(group_id=group_id, student_id=stud.id)
             session.add(gsl)
-            session.commit()
-            groups_to_register.append(gsl)
-        stud.group_links = groups_to_register
-    session.commit()
-    session.refresh(stud)
-    return stud
+            await session.commit()
+    return await session.get(
+        Student, stud.id, options=loaders.STUDENT_OUT, populate_existing=True
+    )
 
 
 @router.put("/{id}", response_model=StudentOut)
-def update_student(
-    *, session: SessionDep, current_user: CurrentUser, id: int, student_in: StudentUpdate
+async def update_student(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    id: int,
+    student_in: StudentUpdate,
 ) -> Any:
     """
     Update a student.
     """
-    stud = session.get(Student, id)
+    stud = await session.get(Student, id, options=loaders.STUDENT_OUT)
     if not stud:
         raise HTTPException(status_code=404, detail="Student not found")
     update_dict = student_in.model_dump(exclude_unset=True)
@@ -94,45 +412,65 @@ def update_student(
     if student_in.groups is not None:
         groups_to_register = []
         for group_id in student_in.groups:
-            g = session.get(Group, group_id)
+            g = await session.get(Group, group_id)
             if not g:
-                raise HTTPException(status_code=404, detail=f"Group not found")
+                raise HTTPException(status_code=404, detail="Group not found")
             # Create link if doesn't exist
-            gsl = session.exec(select(GroupStudentLink).where(GroupStudentLink.student_id == stud.id, GroupStudentLink.group_id == group_id)).first()
+            gsl = (
+                await session.exec(
+                    select(GroupStudentLink).where(
+                        GroupStudentLink.student_id == stud.id,
+                        GroupStudentLink.group_id == group_id,
+                    )
+                )
+            ).first()
             if not gsl:
                 gsl = GroupStudentLink(group_id=group_id, student_id=id)
                 session.add(gsl)
-                session.commit()
+                await session.commit()
             groups_to_register.append(gsl)
-        links_to_unregister = [ link for link in stud.group_links if link not in groups_to_register]
+        links_to_unregister = [
+            link for link in stud.group_links if link not in groups_to_register
+        ]
         for link in links_to_unregister:
-            session.delete(link)
-            session.commit()
+            stud.group_links.remove(link)
+            await session.delete(link)
+            await session.commit()
         stud.group_links = groups_to_register
     session.add(stud)
-    session.commit()
-    session.refresh(stud)
-    return stud
+    await session.commit()
+    return await session.get(
+        Student, id, options=loaders.STUDENT_OUT, populate_existing=True
+    )
 
 
 @router.delete("/{id}")
-def delete_student(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+async def delete_student(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, id: int
+) -> Message:
     """
     Delete an student.
     """
-    stud = session.get(Student, id)
+    stud = await session.get(Student, id)
     if not stud:
         raise HTTPException(status_code=404, detail="Student not found")
     try:
         # Delete GroupLinks
-        grouplinks_statement = delete(GroupStudentLink).where(col(GroupStudentLink.student_id) == id)
-        session.exec(grouplinks_statement)
+        grouplinks_statement = delete(GroupStudentLink).where(
+            col(GroupStudentLink.student_id) == id
+        )
+        await session.exec(grouplinks_statement)
         # Delete Payments
+        await reports.rollup_payments(session, Payment.student_id == id, sign=-1)
         payments_statement = delete(Payment).where(col(Payment.student_id) == id)
-        session.exec(payments_statement)
+        await session.exec(payments_statement)
+        # Delete Balances
+        await session.exec(
+            delete(StudentBalance).where(col(StudentBalance.student_id) == id)
+        )
         # Inactive / Delete student
-        session.delete(stud)
-        session.commit()
+        await session.delete(stud)
+        await session.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occured: {e}")
-    return Message(message="Student deleted successfully")
\ No newline at end of file
+    return Message(message="Student deleted successfully")
@@ -1,7 +1,7 @@
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from sqlmodel import col, delete, select
 
 from app import crud
 from app.api.deps import (
@@ -9,6 +9,8 @@ from app.api.deps import (
     SessionDep,
     get_current_active_superuser,
 )
+from app.api.pagination import CountMode, fetch_page
+from app.core.cache import user_cache
 from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
 from app.models import (
@@ -26,22 +28,34 @@ from app.utils import generate_new_account_email, send_email
 
 router = APIRouter()
 
+USER_ORDER = (User.id,)
+
 
 @router.get(
     "/", dependencies=[Depends(get_current_active_superuser)], response_model=UsersOut
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: SessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count: CountMode = "exact",
+) -> Any:
     """
     Retrieve users.
     """
 
-    statment = select(func.count()).select_from(User)
-    count = session.exec(statment).one()
-
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    users, total, next_cursor = fetch_page(
+        session,
+        select(User),
+        USER_ORDER,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count=count,
+    )
 
-    return UsersOut(data=users, count=count)
+    return UsersOut(data=users, count=total, next_cursor=next_cursor)
 
 
 @router.post(
@@ -89,6 +103,7 @@ def update_user_me(
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
+    user_cache.invalidate(current_user.id)
     session.refresh(current_user)
     return current_user
 
@@ -110,6 +125,7 @@ def update_password_me(
     current_user.hashed_password = hashed_password
     session.add(current_user)
     session.commit()
+    user_cache.invalidate(current_user.id)
     return Message(message="Password updated successfully")
 
 
@@ -215,4 +231,5 @@ def delete_user(
     session.exec(statement)  # type: ignore
     session.delete(user)
     session.commit()
+    user_cache.invalidate(user_id)
     return Message(message="User deleted successfully")
@@ -1,8 +1,12 @@
+from anyio import to_thread
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
+from sqlalchemy import Engine
 
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.core.cache import user_cache
+from app.core.db import async_engine, engine
+from app.models import CacheStats, DatabasePoolsStats, DatabasePoolStats, Message
 from app.utils import generate_test_email, send_email
 
 router = APIRouter()
@@ -24,3 +28,59 @@ def test_email(email_to: EmailStr) -> Message:
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+def _pool_stats(name: str, db_engine: Engine) -> DatabasePoolStats:
+    pool = db_engine.pool
+    wait_stats = pool.wait_stats.snapshot()  # type: ignore[attr-defined]
+    return DatabasePoolStats(
+        name=name,
+        size=pool.size(),  # type: ignore[attr-defined]
+        max_overflow=pool._max_overflow,  # type: ignore[attr-defined]
+        checked_in=pool.checkedin(),  # type: ignore[attr-defined]
+        checked_out=pool.checkedout(),  # type: ignore[attr-defined]
+        overflow=max(pool.overflow(), 0),  # type: ignore[attr-defined]
+        checkouts=wait_stats.checkouts,
+        timeouts=wait_stats.timeouts,
+        wait_time_total=wait_stats.wait_time_total,
+        wait_time_max=wait_stats.wait_time_max,
+    )
+
+
+@router.get(
+    "/db-pool/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=DatabasePoolsStats,
+)
+async def db_pool_stats() -> DatabasePoolsStats:
+    """
+    Database connection pool and threadpool usage.
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    return DatabasePoolsStats(
+        data=[
+            _pool_stats("sync", engine),
+            _pool_stats("async", async_engine.sync_engine),
+        ],
+        threadpool_tokens=int(limiter.total_tokens),
+        threadpool_borrowed=limiter.borrowed_tokens,
+    )
+
+
+@router.get(
+    "/user-cache/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=CacheStats,
+)
+def user_cache_stats() -> CacheStats:
+    """
+    Authenticated users cache usage.
+    """
+    return CacheStats(
+        size=len(user_cache),
+        maxsize=user_cache.maxsize,
+        ttl=user_cache.ttl,
+        hits=user_cache.stats.hits,
+        misses=user_cache.stats.misses,
+        evictions=user_cache.stats.evictions,
+    )
@@ -0,0 +1,71 @@
+import asyncio
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+class TrustedJSONRoute(APIRoute):
+    """
+    Route class writing the response model straight to JSON bytes.
+
+    FastAPI dumps a returned model to a dict, validates the dict against
+    the response model again, encodes it to JSON-compatible Python objects
+    and hands those to `json.dumps`. This route validates the result once
+    against the response model, with `from_attributes=True`, then
+    serializes it with pydantic-core. Instances of the response model pass
+    that validation as they are; anything else, e.g. ORM rows returned as
+    is, goes through a full validation, which is not skipped.
+
+    Use it per router: `APIRouter(route_class=TrustedJSONRoute)`. Routes
+    using `response_model_include` / `exclude` keep the default path.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        if (
+            self.response_field is None
+            or self.response_model_include is not None
+            or self.response_model_exclude is not None
+            or self.response_model_exclude_unset
+            or self.response_model_exclude_defaults
+            or self.response_model_exclude_none
+        ):
+            return super().get_route_handler()
+
+        adapter: TypeAdapter[Any] = TypeAdapter(self.response_model)
+        call = self.dependant.call
+        assert call is not None
+        is_coroutine = asyncio.iscoroutinefunction(call)
+        status_code = self.status_code
+        # The Response dependencies set headers and status codes on, requested
+        # from FastAPI under a private name unless the endpoint takes it
+        endpoint_response_param = self.dependant.response_param_name
+        response_param = endpoint_response_param or "_trusted_json_response"
+        self.dependant.response_param_name = response_param
+
+        async def serialize(**values: Any) -> Any:
+            if endpoint_response_param:
+                sub_response = values[response_param]
+            else:
+                sub_response = values.pop(response_param)
+            if is_coroutine:
+                content = await call(**values)
+            else:
+                content = await run_in_threadpool(call, **values)
+            if isinstance(content, Response):
+                return content
+            content = adapter.validate_python(content, from_attributes=True)
+            response = Response(
+                adapter.dump_json(content, by_alias=True),
+                status_code=sub_response.status_code or status_code or 200,
+                media_type="application/json",
+            )
+            response.headers.raw.extend(sub_response.headers.raw)
+            return response
+
+        self.dependant.call = serialize
+        return super().get_route_handler()
@@ -0,0 +1,526 @@
+"""
+Latency, query count and response size of the main list routes against a
+large seeded dataset, driven through the ASGI app (no server needed):
+
+    python -m app.benchmarks.endpoints seed [--students 5000] [--groups 200]
+        [--lessons 100000] [--payments 200000] [--reset]
+    python -m app.benchmarks.endpoints run [--repeat 50] [--output benchmark.json]
+    python -m app.benchmarks.endpoints compare baseline.json benchmark.json
+
+The dataset is added to the configured database next to the existing rows
+and marked so `seed --reset` and `clear` can remove it again.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+from sqlalchemy import Integer, String, cast, event, func, insert, literal, text
+from sqlalchemy.dialects.postgresql import array
+from sqlmodel import Session, col, delete, select
+
+from app import reports
+from app.core import security
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.main import app
+from app.models import (
+    Group,
+    GroupStudentLink,
+    Lesson,
+    LessonStudentLink,
+    Payment,
+    Student,
+    StudentBalance,
+    User,
+)
+
+# Stored in the notes / description of seeded rows
+MARK = "benchmark"
+FIRST_DAY = datetime.date(2022, 1, 3)
+METHODS = ("cash", "bank_transfer", "mercadopago", "other")
+REASONS = ("one_month", "half_month", "one_lesson", "other")
+
+
+def _bench_students() -> Any:
+    return select(Student.id).where(Student.notes == MARK)
+
+
+def _bench_groups() -> Any:
+    return select(Group.id).where(Group.description == MARK)
+
+
+def _bench_lessons() -> Any:
+    return select(Lesson.id).where(col(Lesson.group_id).in_(_bench_groups()))
+
+
+def _pick(values: tuple[str, ...]) -> Any:
+    # A random element of `values` for each row
+    return array(values)[1 + cast(func.floor(func.random() * len(values)), Integer)]
+
+
+def clear(session: Session) -> None:
+    """
+    Remove the seeded rows, and their contribution to the reports.
+    """
+    lessons = _bench_lessons()
+    students = _bench_students()
+    session.exec(
+        reports.balance_attendance_statement(col(Lesson.id).in_(lessons), sign=-1)
+    )
+    session.exec(
+        reports.payment_rollup_statement(col(Payment.student_id).in_(students), sign=-1)
+    )
+    session.exec(
+        reports.balance_payments_statement(
+            col(Payment.student_id).in_(students), sign=-1
+        )
+    )
+    session.exec(
+        delete(LessonStudentLink).where(col(LessonStudentLink.lesson_id).in_(lessons))
+    )
+    session.exec(delete(Lesson).where(col(Lesson.id).in_(lessons)))
+    session.exec(delete(Payment).where(col(Payment.student_id).in_(students)))
+    session.exec(
+        delete(StudentBalance).where(col(StudentBalance.student_id).in_(students))
+    )
+    session.exec(
+        delete(GroupStudentLink).where(col(GroupStudentLink.student_id).in_(students))
+    )
+    session.exec(delete(Student).where(col(Student.id).in_(students)))
+    session.exec(delete(Group).where(col(Group.id).in_(_bench_groups())))
+    session.commit()
+
+
+def seed(
+    session: Session,
+    *,
+    students: int,
+    groups: int,
+    lessons: int,
+    payments: int,
+    attendance: float,
+) -> None:
+    """
+    Add `groups` groups and `students` students, each in one or two groups,
+    `lessons` lessons spread over the groups on consecutive days, attended
+    by each member with probability `attendance`, and `payments` payments
+    spread over the students, then account them in the reports.
+    """
+    now = datetime.datetime.now()
+    n = func.generate_series(1, groups).table_valued("value").render_derived()
+    session.exec(
+        insert(Group).from_select(
+            ["name", "description"],
+            select(
+                func.concat("Benchmark group ", n.c.value), literal(MARK)
+            ).select_from(n),
+        )
+    )
+    n = func.generate_series(1, students).table_valued("value").render_derived()
+    session.exec(
+        insert(Student).from_select(
+            ["full_name", "city", "notes", "created_at"],
+            select(
+                func.concat(
+                    "Benchmark student ",
+                    n.c.value,
+                    " ",
+                    func.md5(cast(n.c.value, String)),
+                ),
+                func.concat("City ", n.c.value % 50),
+                literal(MARK),
+                literal(now),
+            ).select_from(n),
+        )
+    )
+    group_ids = session.exec(_bench_groups().order_by(Group.id)).all()
+    student_ids = session.exec(_bench_students().order_by(Student.id)).all()
+    links = [
+        {"group_id": group_ids[i % groups], "student_id": student_id, "joined_at": now}
+        for i, student_id in enumerate(student_ids)
+    ] + [
+        {
+            "group_id": group_ids[(i * 7 + 1) % groups],
+            "student_id": student_id,
+            "joined_at": now,
+        }
+        for i, student_id in enumerate(student_ids)
+        if i % 2 and (i * 7 + 1) % groups != i % groups
+    ]
+    session.exec(insert(GroupStudentLink), params=links)
+
+    # Lessons on consecutive days for each group
+    days = -(-lessons // groups)
+    n = func.generate_series(0, days - 1).table_valued("value").render_derived()
+    bench_groups = _bench_groups().subquery()
+    lesson_rows = (
+        select(bench_groups.c.id, literal(FIRST_DAY) + n.c.value, literal(None))
+        .select_from(bench_groups)
+        .join(n, literal(True))
+        .order_by(bench_groups.c.id, n.c.value)
+        .limit(lessons)
+    )
+    session.exec(insert(Lesson).from_select(["group_id", "day", "notes"], lesson_rows))
+    session.exec(
+        insert(LessonStudentLink).from_select(
+            ["lesson_id", "student_id"],
+            select(Lesson.id, GroupStudentLink.student_id)
+            .join(GroupStudentLink, GroupStudentLink.group_id == Lesson.group_id)
+            .where(
+                col(Lesson.group_id).in_(_bench_groups()), func.random() < attendance
+            ),
+        )
+    )
+
+    # Payments spread over the same days
+    per_student = -(-payments // students)
+    n = func.generate_series(1, per_student).table_valued("value").render_derived()
+    bench_students = _bench_students().subquery()
+    first_group = (
+        select(func.min(GroupStudentLink.group_id))
+        .where(GroupStudentLink.student_id == bench_students.c.id)
+        .scalar_subquery()
+    )
+    payment_rows = (
+        select(
+            bench_students.c.id,
+            first_group,
+            literal(FIRST_DAY) + cast(func.random() * days, Integer),
+            500 + 100 * cast(func.random() * 20, Integer),
+            _pick(METHODS),
+            _pick(REASONS),
+            literal(""),
+            literal(now),
+        )
+        .select_from(bench_students)
+        .join(n, literal(True))
+        .limit(payments)
+    )
+    session.exec(
+        insert(Payment).from_select(
+            [
+                "student_id",
+                "group_id",
+                "day",
+                "amount",
+                "method",
+                "reason",
+                "notes",
+                "created_at",
+            ],
+            payment_rows,
+        )
+    )
+
+    student_criteria = col(Payment.student_id).in_(_bench_students())
+    session.exec(reports.payment_rollup_statement(student_criteria, sign=1))
+    session.exec(reports.balance_payments_statement(student_criteria, sign=1))
+    session.exec(
+        reports.balance_attendance_statement(
+            col(Lesson.id).in_(_bench_lessons()), sign=1
+        )
+    )
+    session.commit()
+
+
+def dataset(session: Session) -> dict[str, int]:
+    def count(statement: Any) -> int:
+        return session.exec(
+            select(func.count()).select_from(statement.subquery())
+        ).one()
+
+    lessons = _bench_lessons()
+    return {
+        "students": count(_bench_students()),
+        "groups": count(_bench_groups()),
+        "lessons": count(lessons),
+        "attendances": count(
+            select(LessonStudentLink.lesson_id).where(
+                col(LessonStudentLink.lesson_id).in_(lessons)
+            )
+        ),
+        "payments": count(
+            select(Payment.id).where(col(Payment.student_id).in_(_bench_students()))
+        ),
+    }
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    params: dict[str, Any] = field(default_factory=dict)
+    json: Any = None
+
+
+def scenarios(session: Session) -> list[Scenario]:
+    group_id = session.exec(_bench_groups().order_by(Group.id).limit(1)).first()
+    student_ids = session.exec(_bench_students().order_by(Student.id).limit(50)).all()
+    if group_id is None or not student_ids:
+        sys.exit(
+            "No benchmark dataset, run `python -m app.benchmarks.endpoints seed` first"
+        )
+    students = session.exec(select(func.count()).select_from(Student)).one()
+    api = settings.API_V1_STR
+    ids = ",".join(str(id) for id in student_ids)
+    month = {
+        "day_from": str(FIRST_DAY + datetime.timedelta(days=59)),
+        "day_to": str(FIRST_DAY + datetime.timedelta(days=89)),
+    }
+    return [
+        Scenario("students", "GET", f"{api}/students/"),
+        Scenario(
+            "students_sparse", "GET", f"{api}/students/", {"fields": "id,full_name"}
+        ),
+        Scenario(
+            "students_deep_page",
+            "GET",
+            f"{api}/students/",
+            {"skip": max(students - 100, 0)},
+        ),
+        Scenario("students_group", "GET", f"{api}/students/", {"group_id": group_id}),
+        Scenario("students_ids", "GET", f"{api}/students/", {"ids": ids}),
+        Scenario(
+            "students_batch_get",
+            "POST",
+            f"{api}/students/batch-get",
+            json={"ids": student_ids},
+        ),
+        Scenario(
+            "students_search",
+            "GET",
+            f"{api}/students/search",
+            {"q": "Benchmark student 4321"},
+        ),
+        Scenario("students_balances", "GET", f"{api}/students/balances"),
+        Scenario("groups", "GET", f"{api}/groups/"),
+        Scenario("group_attendance", "GET", f"{api}/groups/{group_id}/attendance"),
+        Scenario("lessons", "GET", f"{api}/lessons/"),
+        Scenario("lessons_group", "GET", f"{api}/lessons/", {"group_id": group_id}),
+        Scenario(
+            "lessons_student", "GET", f"{api}/lessons/", {"student_id": student_ids[0]}
+        ),
+        Scenario("lessons_month", "GET", f"{api}/lessons/", month),
+        Scenario("payments", "GET", f"{api}/payments/"),
+        Scenario(
+            "payments_month_cash",
+            "GET",
+            f"{api}/payments/",
+            {**month, "method": "cash"},
+        ),
+        Scenario(
+            "payments_student",
+            "GET",
+            f"{api}/payments/",
+            {"student_id": student_ids[0]},
+        ),
+        Scenario("payments_summary", "GET", f"{api}/payments/summary"),
+    ]
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+async def measure(
+    client: httpx.AsyncClient, scenario: Scenario, repeat: int, queries: list[int]
+) -> dict[str, Any]:
+    timings = []
+    query_counts = []
+    response = None
+    # One warm up request
+    for i in range(repeat + 1):
+        queries[0] = 0
+        start = time.perf_counter()
+        response = await client.request(
+            scenario.method, scenario.path, params=scenario.params, json=scenario.json
+        )
+        elapsed = time.perf_counter() - start
+        if i:
+            timings.append(elapsed * 1000)
+            query_counts.append(queries[0])
+    assert response is not None
+    return {
+        "status": response.status_code,
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "queries": max(query_counts),
+        "bytes": len(response.content),
+    }
+
+
+async def run(session: Session, repeat: int, only: list[str] | None) -> dict[str, Any]:
+    user = session.exec(
+        select(User).where(User.email == settings.FIRST_SUPERUSER)
+    ).one()
+    token = security.create_access_token(user.id, datetime.timedelta(hours=1))
+    selected = [s for s in scenarios(session) if not only or s.name in only]
+
+    queries = [0]
+
+    def count_query(*args: Any) -> None:
+        queries[0] += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+    results = {}
+    try:
+        # Failing routes are reported with their status instead of stopping the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)  # type: ignore[arg-type]
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://benchmark",
+            headers={"Authorization": f"Bearer {token}"},
+        ) as client:
+            for scenario in selected:
+                results[scenario.name] = await measure(
+                    client, scenario, repeat, queries
+                )
+                print(_format_result(scenario.name, results[scenario.name]), flush=True)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count_query)
+        await async_engine.dispose()
+    return results
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_result(name: str, result: dict[str, Any]) -> str:
+    return (
+        f"{name:<22} {result['status']:>3} p50 {result['p50_ms']:9.2f} ms  "
+        f"p95 {result['p95_ms']:9.2f} ms  {result['queries']:>3} queries  {result['bytes']:>9} bytes"
+    )
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], threshold: float
+) -> bool:
+    """
+    Print the change of every metric, returning False when a p95 latency
+    grew by more than `threshold` (a fraction) or a route needs more queries.
+    """
+    ok = True
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<22} new")
+            continue
+        changes = []
+        for metric in ("p50_ms", "p95_ms", "queries", "bytes"):
+            if before[metric]:
+                changes.append(
+                    f"{metric} {(result[metric] - before[metric]) / before[metric]:+7.1%}"
+                )
+            else:
+                changes.append(f"{metric} {result[metric] - before[metric]:+7}")
+        slower = before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (
+            1 + threshold
+        )
+        regressed = slower or result["queries"] > before["queries"]
+        ok = ok and not regressed
+        print(f"{name:<22} {'  '.join(changes)}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = commands.add_parser("seed", help="add the benchmark dataset")
+    seed_parser.add_argument("--students", type=int, default=5000)
+    seed_parser.add_argument("--groups", type=int, default=200)
+    seed_parser.add_argument("--lessons", type=int, default=100_000)
+    seed_parser.add_argument("--payments", type=int, default=200_000)
+    seed_parser.add_argument(
+        "--attendance",
+        type=float,
+        default=0.8,
+        help="share of members attending a lesson",
+    )
+    seed_parser.add_argument(
+        "--reset", action="store_true", help="remove a previous dataset first"
+    )
+    commands.add_parser("clear", help="remove the benchmark dataset")
+    run_parser = commands.add_parser("run", help="measure the routes")
+    run_parser.add_argument("--repeat", type=int, default=50)
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--only", nargs="*", help="scenario names to run")
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="p95 increase counted as a regression",
+    )
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(0 if compare(baseline, current, args.threshold) else 1)
+
+    with Session(engine) as session:
+        if args.command == "clear":
+            clear(session)
+        elif args.command == "seed":
+            if args.reset:
+                clear(session)
+            elif session.exec(_bench_groups().limit(1)).first() is not None:
+                sys.exit(
+                    "A benchmark dataset exists already, use --reset to replace it"
+                )
+            start = time.perf_counter()
+            seed(
+                session,
+                students=args.students,
+                groups=args.groups,
+                lessons=args.lessons,
+                payments=args.payments,
+                attendance=args.attendance,
+            )
+            session.exec(text("ANALYZE"))
+            session.commit()
+            print(f"Seeded {dataset(session)} in {time.perf_counter() - start:.1f} s")
+        else:
+            results = asyncio.run(run(session, args.repeat, args.only))
+            report = {
+                "commit": _commit(),
+                "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                "repeat": args.repeat,
+                "dataset": dataset(session),
+                "results": results,
+            }
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+            print(f"Written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Cost of a page of students, FastAPI's default response path against
+TrustedJSONRoute: the serialization alone, then whole requests to a route
+returning the page, through the ASGI app. No database needed:
+
+    python -m app.benchmarks.serialization [--rows 100] [--repeat 200]
+"""
+import argparse
+import asyncio
+import datetime
+import time
+from collections.abc import Callable
+from typing import Any
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+
+from app.api.routing import TrustedJSONRoute
+from app.models import GroupStudentLink, Student, StudentsOut
+
+
+def make_students(rows: int) -> list[Student]:
+    now = datetime.datetime.now()
+    return [
+        Student(
+            id=i,
+            full_name=f"Student {i}",
+            city="Montevideo",
+            notes="Some notes about the student",
+            created_at=now,
+            group_links=[
+                GroupStudentLink(group_id=group_id, student_id=i, joined_at=now)
+                for group_id in range(3)
+            ],
+        )
+        for i in range(rows)
+    ]
+
+
+def default_path(page: Any) -> bytes:
+    # What FastAPI does with a `response_model=StudentsOut` route
+    field = create_response_field(name="response", type_=StudentsOut)
+    content = asyncio.run(
+        serialize_response(field=field, response_content=page, is_coroutine=True)
+    )
+    return JSONResponse(content).body
+
+
+adapter: TypeAdapter[StudentsOut] = TypeAdapter(StudentsOut)
+
+
+def trusted_path(page: Any) -> bytes:
+    # What TrustedJSONRoute does
+    page = adapter.validate_python(page, from_attributes=True)
+    return adapter.dump_json(page, by_alias=True)
+
+
+def timeit(func: Callable[[Any], bytes], page: Any, repeat: int) -> float:
+    func(page)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(page)
+    return (time.perf_counter() - start) / repeat
+
+
+def make_app(students: list[Student]) -> FastAPI:
+    # The same route on both paths, returning ORM rows like the list routes
+    app = FastAPI()
+    for prefix, route_class in [("/default", APIRoute), ("/trusted", TrustedJSONRoute)]:
+        router = APIRouter(route_class=route_class)
+
+        @router.get("/students", response_model=StudentsOut)
+        async def read_students() -> Any:
+            return {"data": students, "count": len(students)}
+
+        app.include_router(router, prefix=prefix)
+    return app
+
+
+async def time_requests(app: FastAPI, repeat: int) -> dict[str, float]:
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    timings = {}
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark"
+    ) as client:
+        bodies = set()
+        for path in ["/default/students", "/trusted/students"]:
+            bodies.add((await client.get(path)).content)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                await client.get(path)
+            timings[path] = (time.perf_counter() - start) / repeat
+        assert len(bodies) == 1
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    students = make_students(args.rows)
+    page = StudentsOut(data=students, count=args.rows)
+    assert default_path(page) == trusted_path(page)
+    default = timeit(default_path, page, args.repeat)
+    trusted = timeit(trusted_path, page, args.repeat)
+    print(f"{args.rows} students, mean of {args.repeat} runs")
+    print("serialization")
+    print(f"  default: {default * 1000:8.3f} ms")
+    print(f"  trusted: {trusted * 1000:8.3f} ms ({default / trusted:.1f}x)")
+
+    timings = asyncio.run(time_requests(make_app(students), args.repeat))
+    default, trusted = timings["/default/students"], timings["/trusted/students"]
+    print("request")
+    print(f"  default: {default * 1000:8.3f} ms")
+    print(f"  trusted: {trusted * 1000:8.3f} ms ({default / trusted:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
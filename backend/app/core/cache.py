@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.config import settings
+from app.models import User
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread safe in-process LRU cache whose entries expire `ttl` seconds after
+    being stored. A `ttl` or `maxsize` of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        if not self.maxsize or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Active users by id, so authenticated requests skip the user lookup. Every
+# process has its own cache: changes made by other processes are seen at
+# most USER_CACHE_TTL seconds later.
+user_cache: TTLCache[int, User] = TTLCache(
+    maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL
+)
+
+
+def cache_user(user: User) -> None:
+    """
+    Store a detached copy of `user`, independent of the session it came from.
+    Sessions take it back with `merge(user, load=False)`, without a query.
+    """
+    copy = User(**user.model_dump())
+    make_transient_to_detached(copy)
+    user_cache.set(user.id, copy)  # type: ignore[arg-type]
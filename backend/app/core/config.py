@@ -53,6 +53,53 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str = ""
+    # Connection pool, applied to both the sync and the async engine. Each
+    # engine has its own pool, so a worker process may open up to
+    # 2 * (POSTGRES_POOL_SIZE + POSTGRES_MAX_OVERFLOW) connections: keep
+    # Postgres' max_connections above that times the number of workers.
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30
+    POSTGRES_POOL_RECYCLE: int = 30 * 60
+    POSTGRES_POOL_PRE_PING: bool = True
+    # 0 disables the server side statement timeout
+    POSTGRES_STATEMENT_TIMEOUT_MS: int = 30 * 1000
+    # Student balances: every attended lesson is charged LESSON_PRICE, up to
+    # MONTHLY_FEE per month (0 disables the cap). Both must be set, the
+    # balances route answers 503 otherwise
+    LESSON_PRICE: int | None = None
+    MONTHLY_FEE: int | None = None
+    # Count and time the SQL statements of each request, reported in a
+    # Server-Timing header and a log line
+    QUERY_STATS: bool = False
+    # Largest student import accepted, larger uploads answer 413
+    STUDENT_IMPORT_MAX_ROWS: int = 10_000
+    STUDENT_IMPORT_MAX_BYTES: int = 5 * 1024 * 1024
+    # In-process cache of authenticated users, 0 disables it
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL: float = 60
+    # Processes hashing and verifying passwords for the async routes, and how
+    # many jobs may be pending before they answer 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+    # Proxies in front of the app (IPs or networks, e.g. Traefik's). The
+    # client IP comes from their X-Forwarded-For header, otherwise every
+    # client behind them shares the proxy's IP
+    TRUSTED_PROXIES: Annotated[list[str] | str, BeforeValidator(parse_cors)] = []
+    # Login and password recovery throttling, per client IP and per email.
+    # `postgres` shares the buckets between workers, `none` disables it.
+    LOGIN_RATE_LIMIT_STORE: Literal["memory", "postgres", "none"] = "memory"
+    LOGIN_IP_BURST: int = 30
+    LOGIN_IP_PER_MINUTE: float = 30
+    LOGIN_EMAIL_BURST: int = 10
+    LOGIN_EMAIL_PER_MINUTE: float = 10
+    # Background jobs: attempts before giving up, exponential retry backoff
+    # in seconds, and how long a running job may go before being retried
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF: float = 30
+    JOB_RETRY_BACKOFF_MAX: float = 60 * 60
+    JOB_TIMEOUT: float = 10 * 60
+    JOB_POLL_INTERVAL: float = 1
 
     @computed_field  # type: ignore[misc]
     @property
@@ -82,6 +129,8 @@ class Settings(BaseSettings):
             self.EMAILS_FROM_NAME = self.PROJECT_NAME
         return self
 
+    # Check email templates for changes on every render, for development
+    EMAIL_TEMPLATES_AUTO_RELOAD: bool = False
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
     @computed_field  # type: ignore[misc]
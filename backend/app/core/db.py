@@ -1,10 +1,157 @@
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core import versions  # noqa: F401 tracks table versions of every session
 from app.core.config import settings
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+@dataclass
+class PoolWaitStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+    # Checkouts happen in any thread using the engine
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    def record(self, wait_time: float, timed_out: bool = False) -> None:
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def snapshot(self) -> "PoolWaitStats":
+        with self.lock:
+            return replace(self)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long checkouts wait for a free connection. Each
+    engine has its own stats, kept when the engine is disposed.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def recreate(self) -> Any:
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool, TimedQueuePool):
+    pass
+
+
+def engine_options() -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "pool_size": settings.POSTGRES_POOL_SIZE,
+        "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+        "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    }
+    if settings.POSTGRES_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={settings.POSTGRES_STATEMENT_TIMEOUT_MS}"
+        }
+    return options
+
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedQueuePool,
+    **engine_options(),
+)
+# Same database through psycopg's async driver, used by the async routers
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **engine_options(),
+)
+
+
+@dataclass
+class QueryStats:
+    """
+    SQL statements run while serving one request, see QueryStatsMiddleware.
+    """
+
+    count: int = 0
+    duration: float = 0.0
+    slowest: float = 0.0
+    slowest_statement: str | None = None
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest:
+            self.slowest = duration
+            self.slowest_statement = statement
+
+
+# Stats of the current request, None outside of requests or when disabled.
+# The object is shared with the threads running sync routes, which get a
+# copy of the context.
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    if query_stats.get() is not None:
+        context.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    stats = query_stats.get()
+    start = getattr(context, "query_start", None)
+    if stats is not None and start is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
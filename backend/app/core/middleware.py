@@ -0,0 +1,76 @@
+import logging
+import re
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.db import QueryStats, query_stats
+
+logger = logging.getLogger(__name__)
+
+# Longest part of the slowest statement written to the log
+SLOWEST_STATEMENT_LENGTH = 500
+
+
+def server_timing(stats: QueryStats) -> str:
+    return (
+        f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+        f"db-slowest;dur={stats.slowest * 1000:.1f}"
+    )
+
+
+class QueryStatsMiddleware:
+    """
+    Collect the SQL statements run by each request when QUERY_STATS is set.
+    The count and the total and slowest durations are added to the response
+    as a Server-Timing header and logged with the slowest statement once the
+    response is sent. Statements are not sent to clients.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.QUERY_STATS:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", server_timing(stats)
+                )
+            await send(message)
+
+        token = query_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            query_stats.reset(token)
+            slowest = re.sub(r"\s+", " ", stats.slowest_statement or "")[
+                :SLOWEST_STATEMENT_LENGTH
+            ]
+            # WARNING: the app sets up no logging, lower levels are dropped.
+            # The line is only written when QUERY_STATS is set anyway
+            logger.warning(
+                f"{scope['method']} {scope['path']} status={status} queries={stats.count} "
+                f"db_ms={stats.duration * 1000:.1f} slowest_ms={stats.slowest * 1000:.1f} "
+                f"total_ms={(time.perf_counter() - start) * 1000:.1f} slowest={slowest!r}",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "queries": stats.count,
+                    "db_ms": stats.duration * 1000,
+                    "slowest_ms": stats.slowest * 1000,
+                    "slowest_statement": slowest,
+                },
+            )
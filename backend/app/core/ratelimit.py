@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.db import async_engine
+from app.models import RateLimitBucket
+
+
+class BucketStore(Protocol):
+    async def take(self, key: str, burst: int, per_minute: float) -> float:
+        """
+        Take a token from the bucket `key`, holding up to `burst` tokens and
+        refilled with `per_minute` tokens a minute. Returns 0 when a token
+        was taken, otherwise the seconds until one is available.
+        """
+        ...
+
+
+class MemoryBucketStore:
+    """
+    Buckets of the current process, the least recently used ones are
+    forgotten past `maxsize` keys.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, burst: int, per_minute: float) -> float:
+        rate = per_minute / 60
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class PostgresBucketStore:
+    """
+    Buckets shared by every worker, refilled and taken from in a single
+    upsert on the ratelimitbucket table.
+    """
+
+    async def take(self, key: str, burst: int, per_minute: float) -> float:
+        rate = per_minute / 60
+        elapsed = func.extract("epoch", func.now() - RateLimitBucket.updated_at)
+        tokens = func.least(burst, RateLimitBucket.tokens + elapsed * rate)
+        statement = insert(RateLimitBucket).values(
+            key=key, tokens=burst - 1, updated_at=func.now()
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[RateLimitBucket.key],
+            set_={"tokens": tokens - 1, "updated_at": func.now()},
+            where=tokens >= 1,
+        ).returning(RateLimitBucket.tokens)
+        async with async_engine.begin() as conn:
+            taken = (await conn.execute(statement)).first()
+        # The bucket is not read when nothing is taken: wait for a full token
+        return 0.0 if taken else 1 / rate
+
+
+def get_store() -> BucketStore | None:
+    if settings.LOGIN_RATE_LIMIT_STORE == "memory":
+        return memory_store
+    if settings.LOGIN_RATE_LIMIT_STORE == "postgres":
+        return postgres_store
+    return None
+
+
+memory_store = MemoryBucketStore()
+postgres_store = PostgresBucketStore()
+
+
+async def check_login_rate(scope: str, ip: str | None, email: str) -> int:
+    """
+    Take a token from both the client IP and the `scope` email buckets.
+    Returns 0 when allowed, otherwise the whole seconds to wait. The email
+    bucket is left untouched when the IP one is empty.
+    """
+    store = get_store()
+    if store is None:
+        return 0
+    retry_after = 0.0
+    if ip:
+        retry_after = await store.take(
+            f"ip:{ip}", settings.LOGIN_IP_BURST, settings.LOGIN_IP_PER_MINUTE
+        )
+    if not retry_after:
+        retry_after = await store.take(
+            f"{scope}:{email.lower()}",
+            settings.LOGIN_EMAIL_BURST,
+            settings.LOGIN_EMAIL_PER_MINUTE,
+        )
+    return math.ceil(retry_after)
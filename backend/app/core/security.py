@@ -1,5 +1,10 @@
+import asyncio
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, TypeVar
 
 from jose import jwt
 from passlib.context import CryptContext
@@ -11,6 +16,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.utcnow() + expires_delta
@@ -25,3 +32,62 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when PASSWORD_HASH_QUEUE_SIZE password jobs are already pending.
+    """
+
+
+# bcrypt is CPU bound on purpose: async routes run it in a dedicated process
+# pool, so a burst of logins is limited to PASSWORD_HASH_WORKERS cores and
+# never takes threads or the event loop away from the other routes.
+_password_pool: ProcessPoolExecutor | None = None
+# Pending jobs. Only the app's event loop touches it, and there is no await
+# between the check and the increment in _run_password_job, so the
+# PASSWORD_HASH_QUEUE_SIZE limit is exact without a lock. Running the async
+# helpers on event loops in other threads would break that.
+_password_jobs = 0
+
+
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _password_pool
+
+
+def shutdown_password_pool() -> None:
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(cancel_futures=True)
+        _password_pool = None
+
+
+async def _run_password_job(func: Callable[..., T], *args: Any) -> T:
+    global _password_pool, _password_jobs
+    if _password_jobs >= settings.PASSWORD_HASH_QUEUE_SIZE:
+        raise PasswordHasherBusy()
+    _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_password_pool(), func, *args)
+        except BrokenProcessPool:
+            # A worker died, start over with a new pool
+            _password_pool = None
+            return await loop.run_in_executor(_get_password_pool(), func, *args)
+    finally:
+        _password_jobs -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
@@ -0,0 +1,75 @@
+from collections.abc import Iterable
+
+from sqlalchemy import Insert, event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import ORMExecuteState, Session, SessionTransaction, UOWTransaction
+
+from app.models import TableVersion
+
+# Tables whose version is tracked, the ones behind conditional GET routes
+VERSIONED_TABLES = frozenset(
+    {"group", "groupstudentlink", "lesson", "lessonstudentlink", "payment", "student"}
+)
+
+
+def bump_statement(tables: Iterable[str]) -> Insert:
+    """
+    Increment the version of `tables`, in a fixed order so that concurrent
+    writers lock the rows the same way.
+    """
+    statement = insert(TableVersion).values(
+        [{"table_name": table, "version": 1} for table in sorted(tables)]
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[TableVersion.table_name],
+        set_={"version": TableVersion.version + 1},
+    )
+
+
+def _touch(session: Session, tables: set[str]) -> None:
+    session.info.setdefault("touched_tables", set()).update(tables & VERSIONED_TABLES)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context: UOWTransaction) -> None:
+    # Many-to-many collections are flushed along with their parent, which
+    # is dirty too: its link table is bumped with it
+    tables = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            tables.add(table.name)
+            for relationship in type(obj).__mapper__.relationships:
+                if relationship.secondary is not None:
+                    tables.add(relationship.secondary.name)
+    _touch(session, tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _do_orm_execute(orm_execute_state: ORMExecuteState) -> None:
+    # Bulk INSERT / UPDATE / DELETE statements bypass the flush
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        table = orm_execute_state.statement.table  # type: ignore[attr-defined]
+        _touch(orm_execute_state.session, {table.name})
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session: Session) -> None:
+    # One bump per transaction, right before it commits: the version rows
+    # are locked for as short as possible, and always in the same order
+    session.flush()
+    tables = session.info.pop("touched_tables", None)
+    if tables:
+        session.connection().execute(bump_statement(tables))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _after_transaction_end(session: Session, transaction: SessionTransaction) -> None:
+    # Forget the tables of a rolled back transaction. Savepoints are kept:
+    # bumping a table that was not written only costs a cache miss
+    if transaction.parent is None:
+        session.info.pop("touched_tables", None)
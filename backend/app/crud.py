@@ -1,8 +1,11 @@
 from typing import Any
 
+from sqlalchemy import Row
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.security import get_password_hash, verify_password
+from app.core.cache import user_cache
+from app.core.security import get_password_hash, verify_password, verify_password_async
 from app.models import User, UserCreate, UserUpdate
 
 
@@ -26,6 +29,7 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     session.commit()
+    user_cache.invalidate(db_user.id)
     session.refresh(db_user)
     return db_user
 
@@ -43,3 +47,23 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     if not verify_password(password, db_user.hashed_password):
         return None
     return db_user
+
+
+async def authenticate_async(
+    *, session: AsyncSession, email: str, password: str
+) -> Row[tuple[int, bool, str]] | None:
+    """
+    The id and is_active of the user if the password matches.
+    """
+    statement = select(User.id, User.is_active, User.hashed_password).where(
+        User.email == email
+    )
+    db_user = (await session.exec(statement)).first()
+    # End the transaction before hashing, the connection goes back to the
+    # pool instead of idling while the password is verified
+    await session.commit()
+    if not db_user:
+        return None
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+    return db_user
@@ -0,0 +1,127 @@
+import datetime
+import logging
+import random
+from collections.abc import Callable
+from typing import Any
+
+from sqlmodel import Session, col, select, update
+
+from app.core.config import settings
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Job functions by name, registered with @task
+TASKS: dict[str, Callable[..., Any]] = {}
+
+
+def task(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Register a function the worker can run as job `name`. Its keyword
+    arguments are the JSON payload of the job.
+    """
+
+    def register(func: Callable[..., Any]) -> Callable[..., Any]:
+        TASKS[name] = func
+        return func
+
+    return register
+
+
+def enqueue(
+    session: Session,
+    name: str,
+    *,
+    run_at: datetime.datetime | None = None,
+    max_attempts: int | None = None,
+    **payload: Any,
+) -> Job:
+    """
+    Add a job to the session, it is queued when the session commits.
+    """
+    job = Job(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=run_at or datetime.datetime.now(),
+    )
+    session.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter, in seconds, before the next attempt.
+    """
+    delay = min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX
+    )
+    return random.uniform(delay / 2, delay)
+
+
+def claim_job(session: Session) -> Job | None:
+    """
+    Take the next job due, or one left running longer than JOB_TIMEOUT by a
+    worker that died. Rows locked by other workers are skipped, so any
+    number of workers can poll the table. Stale jobs without attempts left
+    are marked `failed` instead.
+    """
+    now = datetime.datetime.now()
+    stale = now - datetime.timedelta(seconds=settings.JOB_TIMEOUT)
+    timed_out = (Job.status == "running", col(Job.locked_at) < stale)
+    session.exec(
+        update(Job)
+        .where(*timed_out, col(Job.attempts) >= Job.max_attempts)
+        .values(status="failed", locked_at=None, last_error="Timed out")
+    )
+    for statement in (
+        select(Job)
+        .where(Job.status == "queued", Job.run_at <= now)
+        .order_by(Job.run_at),
+        select(Job).where(*timed_out, col(Job.attempts) < Job.max_attempts),
+    ):
+        job = session.exec(statement.limit(1).with_for_update(skip_locked=True)).first()
+        if job:
+            job.status = "running"
+            job.locked_at = now
+            job.attempts += 1
+            session.add(job)
+            session.commit()
+            return job
+    session.commit()
+    return None
+
+
+def run_job(session: Session, job: Job) -> None:
+    """
+    Run a claimed job. It is deleted when it succeeds, scheduled again with
+    a backoff when it fails, and kept as `failed` after its last attempt.
+    """
+    try:
+        TASKS[job.name](**job.payload)
+    except Exception as e:
+        logger.exception(f"Job {job.id} ({job.name}) failed, attempt {job.attempts}")
+        job.last_error = f"{type(e).__name__}: {e}"
+        job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+        else:
+            job.status = "queued"
+            job.run_at = datetime.datetime.now() + datetime.timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+        session.add(job)
+    else:
+        session.delete(job)
+    session.commit()
+
+
+def run_pending(session: Session) -> int:
+    """
+    Run jobs until none is due, returning how many were run.
+    """
+    count = 0
+    while job := claim_job(session):
+        run_job(session, job)
+        count += 1
+    return count
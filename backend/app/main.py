@@ -1,21 +1,45 @@
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.db import async_engine
+from app.core.middleware import QueryStatsMiddleware
+from app.core.security import shutdown_password_pool
+from app.utils import load_email_templates
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    # Sync routes and dependencies run in anyio's threadpool, each holding a
+    # database connection: size the threadpool to what the pool can serve so
+    # bursts queue for a thread instead of timing out waiting for a connection.
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.POSTGRES_POOL_SIZE + settings.POSTGRES_MAX_OVERFLOW
+    load_email_templates()
+    yield
+    shutdown_password_pool()
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
+app.add_middleware(QueryStatsMiddleware)
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -1,7 +1,10 @@
 import datetime
+from typing import Any
 
-from sqlmodel import Field, Relationship, SQLModel
 from pydantic import validator
+from sqlalchemy import Column, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Field, Relationship, SQLModel
 
 
 # Shared properties
@@ -56,7 +59,8 @@ class UserOut(UserBase):
 
 class UsersOut(SQLModel):
     data: list[UserOut]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -64,6 +68,75 @@ class Message(SQLModel):
     message: str
 
 
+# Ids to fetch with a POST /batch-get, results keep their order
+class BatchGet(SQLModel):
+    ids: list[int]
+
+
+class DatabasePoolStats(SQLModel):
+    name: str
+    size: int
+    max_overflow: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_time_total: float
+    wait_time_max: float
+
+
+class DatabasePoolsStats(SQLModel):
+    data: list[DatabasePoolStats]
+    threadpool_tokens: int
+    threadpool_borrowed: int
+
+
+class CacheStats(SQLModel):
+    size: int
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    evictions: int
+
+
+# Login throttling token bucket, used by the postgres rate limit store
+class RateLimitBucket(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    tokens: float
+    updated_at: datetime.datetime
+
+
+# Incremented by every transaction writing to the table, see app/core/versions.py
+class TableVersion(SQLModel, table=True):
+    table_name: str = Field(primary_key=True)
+    version: int = 0
+
+
+# Background job, run by the worker (app/worker.py)
+class Job(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_job_queued_run_at", "run_at", postgresql_where=text("status = 'queued'")
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    name: str
+    payload: dict[str, Any] = Field(
+        default_factory=dict, sa_column=Column(JSONB, nullable=False)
+    )
+    # queued / running / done / failed
+    status: str = "queued"
+    attempts: int = 0
+    max_attempts: int
+    run_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    locked_at: datetime.datetime | None = None
+    last_error: str | None = None
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
 # JSON payload containing access token
 class Token(SQLModel):
     access_token: str
@@ -83,38 +156,62 @@ class NewPassword(SQLModel):
 # Link models
 class GroupStudentLink(SQLModel, table=True):
     group_id: int | None = Field(default=None, foreign_key="group.id", primary_key=True)
-    student_id: int | None = Field(default=None, foreign_key="student.id", primary_key=True)
+    student_id: int | None = Field(
+        default=None, foreign_key="student.id", primary_key=True, index=True
+    )
     joined_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
-    
+
     group: "Group" = Relationship(back_populates="student_links")
     student: "Student" = Relationship(back_populates="group_links")
 
 
 class LessonStudentLink(SQLModel, table=True):
-    lesson_id: int | None = Field(default=None, foreign_key="lesson.id", primary_key=True)
-    student_id: int | None = Field(default=None, foreign_key="student.id", primary_key=True)
+    lesson_id: int | None = Field(
+        default=None, foreign_key="lesson.id", primary_key=True
+    )
+    student_id: int | None = Field(
+        default=None, foreign_key="student.id", primary_key=True, index=True
+    )
 
 
 class StudentBase(SQLModel):
-    full_name: str 
+    full_name: str
     city: str | None = None
     responsible_adult_full_name: str | None = None
     responsible_adult_phone_number: str | None = None
     notes: str | None = None
 
-    @validator('responsible_adult_phone_number')
+    @validator("responsible_adult_phone_number")
     def validate_responsible_adult_phone_number(cls, v):
         if v and not v.isnumeric():
-            raise ValueError('Not a valid phone number')
+            raise ValueError("Not a valid phone number")
         return v
-    
+
+
+# Text /students/search matches, the trigram index is built on this exact
+# expression so queries must repeat it verbatim to use it
+STUDENT_SEARCH_DOCUMENT = (
+    "coalesce(full_name, '') || ' ' || coalesce(city, '') || ' ' "
+    "|| coalesce(responsible_adult_full_name, '')"
+)
+
 
 class Student(StudentBase, table=True):
+    __table_args__ = (
+        Index(
+            "ix_student_search_trgm",
+            text(f"({STUDENT_SEARCH_DOCUMENT}) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
 
     payments: list["Payment"] = Relationship(back_populates="student")
-    lessons: list["Lesson"] = Relationship(back_populates="assistants", link_model=LessonStudentLink)
+    lessons: list["Lesson"] = Relationship(
+        back_populates="assistants", link_model=LessonStudentLink
+    )
     group_links: list[GroupStudentLink] = Relationship(back_populates="student")
 
 
@@ -125,7 +222,8 @@ class StudentOut(StudentBase):
 
 class StudentsOut(SQLModel):
     data: list[StudentOut]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 
 class StudentCreate(StudentBase):
@@ -136,7 +234,28 @@ class StudentCreate(StudentBase):
 class StudentUpdate(StudentBase):
     full_name: str
     groups: list[int]
-    
+
+
+# One row of a bulk import, groups may be given as "1;2" in CSV files
+class StudentImport(StudentBase):
+    groups: list[int] = []
+
+    @validator("groups", pre=True)
+    def split_groups(cls, v):
+        if isinstance(v, str):
+            return [g for g in v.replace(",", ";").split(";") if g.strip()]
+        return v or []
+
+
+class StudentImportError(SQLModel):
+    row: int
+    errors: list[str]
+
+
+class StudentsImportOut(SQLModel):
+    created: list[int]
+    errors: list[StudentImportError]
+
 
 class GroupBase(SQLModel):
     name: str
@@ -158,7 +277,18 @@ class GroupOut(GroupBase):
 
 class GroupsOut(SQLModel):
     data: list[GroupOut] = []
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+
+# Attendance sheet of a group: one presence string per student, with a "1"
+# for each lesson (in `lessons` / `days` order) the student attended
+class GroupAttendance(SQLModel):
+    group_id: int
+    students: list[int]
+    lessons: list[int]
+    days: list[datetime.date]
+    presence: list[str]
 
 
 class GroupCreate(GroupBase):
@@ -169,38 +299,58 @@ class GroupUpdate(GroupBase):
     pass
 
 
+# Payment reasons that pay for lessons, counted in the student balances
+TUITION_REASONS = ("one_month", "half_month", "one_lesson")
+
+
 class PaymentBase(SQLModel):
     amount: int
     notes: str | None = None
     day: datetime.date
-    method: str = 'other'
-    reason: str = 'other'
+    method: str = "other"
+    reason: str = "other"
 
-    @validator('amount')
+    @validator("amount")
     def validate_amount(cls, v):
         if v < 0:
-            raise ValueError('Amount must be a positive integer')
+            raise ValueError("Amount must be a positive integer")
         return v
 
-    @validator('method')
+    @validator("method")
     def validate_method(cls, v):
-        SUPPORTED_METHODS = ['mercadopago', 'cash', 'bank_transfer', 'other']
+        SUPPORTED_METHODS = ["mercadopago", "cash", "bank_transfer", "other"]
         if v not in SUPPORTED_METHODS:
-            raise ValueError('Payment method should be one of mercadopago / cash / bank_transfer / other')
+            raise ValueError(
+                "Payment method should be one of mercadopago / cash / bank_transfer / other"
+            )
         return v
-    
-    @validator('reason')
+
+    @validator("reason")
     def validate_reason(cls, v):
-        SUPPORTED_REASONS = ['one_month', 'half_month', 'one_lesson', 'other']
+        SUPPORTED_REASONS = ["one_month", "half_month", "one_lesson", "other"]
         if v not in SUPPORTED_REASONS:
-            raise ValueError('Payment reason should be one of one_month / half_month / one_lesson / other')
+            raise ValueError(
+                "Payment reason should be one of one_month / half_month / one_lesson / other"
+            )
         return v
 
 
 # Database model, database table inferred from class name
 class Payment(PaymentBase, table=True):
+    __table_args__ = (
+        Index("ix_payment_student_id_day", "student_id", "day"),
+        # Date range and attribute filters of the payment list, in its order
+        Index("ix_payment_day_id", "day", "id"),
+        Index("ix_payment_method_day_id", "method", "day", "id"),
+        Index("ix_payment_reason_day_id", "reason", "day", "id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     student_id: int = Field(default=None, foreign_key="student.id", nullable=False)
+    # Group the payment is accounted to in revenue reports: the student's
+    # first group when the payment was registered. Not a foreign key so the
+    # reports stay consistent when groups are removed.
+    group_id: int | None = None
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
     student: Student = Relationship(back_populates="payments")
 
@@ -226,7 +376,72 @@ class PaymentOut(SQLModel):
 
 class PaymentsOut(SQLModel):
     data: list[PaymentOut]
-    count: int = 0
+    count: int | None = 0
+    next_cursor: str | None = None
+
+
+# Revenue totals maintained on every payment write, one row per
+# month (first day) x group x method x reason
+class PaymentRollup(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_paymentrollup_key",
+            "month",
+            text("coalesce(group_id, 0)"),
+            "method",
+            "reason",
+            unique=True,
+        ),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    month: datetime.date
+    group_id: int | None = None
+    method: str
+    reason: str
+    amount: int = 0
+    payments: int = 0
+
+
+class PaymentRollupOut(SQLModel):
+    month: datetime.date
+    group_id: int | None
+    method: str
+    reason: str
+    amount: int
+    payments: int
+
+
+class PaymentsSummary(SQLModel):
+    data: list[PaymentRollupOut]
+    amount: int
+    payments: int
+
+
+# Lessons attended and amount paid by a student in a month, kept up to date
+# by the lesson and payment routes so balances never scan the full history
+class StudentBalance(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("student_id", "month"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="student.id", nullable=False)
+    month: datetime.date
+    lessons_attended: int = 0
+    amount_paid: int = 0
+
+
+class StudentBalanceOut(SQLModel):
+    student_id: int
+    full_name: str
+    lessons_attended: int
+    amount_due: int
+    amount_paid: int
+    owed: int
+
+
+class StudentBalancesOut(SQLModel):
+    data: list[StudentBalanceOut]
+    count: int
 
 
 class LessonBase(SQLModel):
@@ -235,10 +450,18 @@ class LessonBase(SQLModel):
 
 
 class Lesson(LessonBase, table=True):
+    __table_args__ = (
+        Index("ix_lesson_group_id_day", "group_id", "day", unique=True),
+        # Date range filters of the lesson list, in its order
+        Index("ix_lesson_day_id", "day", "id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     group_id: int = Field(default=None, foreign_key="group.id", nullable=False)
     group: "Group" = Relationship(back_populates="lessons")
-    assistants: list["Student"] = Relationship(back_populates="lessons", link_model=LessonStudentLink)
+    assistants: list["Student"] = Relationship(
+        back_populates="lessons", link_model=LessonStudentLink
+    )
 
 
 class LessonCreate(LessonBase):
@@ -250,6 +473,30 @@ class LessonUpdate(LessonBase):
     assistants: list[int]
 
 
+# Create a group's lessons on the given weekdays (0 = Monday) of a date range
+class LessonsGenerate(SQLModel):
+    group_id: int
+    day_from: datetime.date
+    day_to: datetime.date
+    weekdays: list[int]
+    with_assistants: bool = False
+
+    @validator("weekdays")
+    def validate_weekdays(cls, v):
+        if not v or any(day < 0 or day > 6 for day in v):
+            raise ValueError("Weekdays should be between 0 (Monday) and 6 (Sunday)")
+        return v
+
+    @validator("day_to")
+    def validate_day_to(cls, v, values):
+        day_from = values.get("day_from")
+        if day_from and v < day_from:
+            raise ValueError("day_to should not be before day_from")
+        if day_from and (v - day_from).days > 366:
+            raise ValueError("The date range should not exceed one year")
+        return v
+
+
 class LessonOut(SQLModel):
     id: int
     group: GroupOut
@@ -259,4 +506,5 @@ class LessonOut(SQLModel):
 
 class LessonsOut(SQLModel):
     data: list[LessonOut]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
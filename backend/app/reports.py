@@ -0,0 +1,182 @@
+from typing import Any
+
+from sqlalchemy import ColumnElement, Date, Select, cast, func, literal
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import (
+    TUITION_REASONS,
+    GroupStudentLink,
+    Lesson,
+    LessonStudentLink,
+    Payment,
+    PaymentRollup,
+    Student,
+    StudentBalance,
+)
+
+
+class BalancesNotConfigured(Exception):
+    """
+    Raised when LESSON_PRICE or MONTHLY_FEE is not set.
+    """
+
+
+# Columns of the unique index the rollup upserts conflict on
+ROLLUP_KEY = (
+    PaymentRollup.month,
+    func.coalesce(PaymentRollup.group_id, 0),
+    PaymentRollup.method,
+    PaymentRollup.reason,
+)
+
+
+def _month(day: Any) -> ColumnElement[Any]:
+    return cast(func.date_trunc("month", day), Date)
+
+
+def payment_rollup_statement(*criteria: ColumnElement[bool], sign: int) -> Insert:
+    """
+    Add (sign=1) or remove (sign=-1) the payments matching `criteria` from the
+    revenue rollup, in a single INSERT ... SELECT ... ON CONFLICT statement.
+    """
+    month = _month(Payment.day)
+    totals = (
+        select(
+            month,
+            Payment.group_id,
+            Payment.method,
+            Payment.reason,
+            sign * func.sum(Payment.amount),
+            sign * func.count(),
+        )
+        .where(*criteria)
+        .group_by(month, Payment.group_id, Payment.method, Payment.reason)
+    )
+    statement = insert(PaymentRollup).from_select(
+        ["month", "group_id", "method", "reason", "amount", "payments"], totals
+    )
+    return statement.on_conflict_do_update(
+        index_elements=ROLLUP_KEY,
+        set_={
+            "amount": PaymentRollup.amount + statement.excluded.amount,
+            "payments": PaymentRollup.payments + statement.excluded.payments,
+        },
+    )
+
+
+async def rollup_payments(
+    session: AsyncSession, *criteria: ColumnElement[bool], sign: int = 1
+) -> None:
+    """
+    Apply payments to the rollup. Must run in the transaction that writes
+    them: after the payments are flushed when adding, before they are
+    changed or deleted when removing.
+    """
+    await session.exec(payment_rollup_statement(*criteria, sign=sign))
+
+
+async def account_payments(
+    session: AsyncSession, *criteria: ColumnElement[bool], sign: int = 1
+) -> None:
+    """
+    Apply payments to both the revenue rollup and the student balances, with
+    the same rules as `rollup_payments`.
+    """
+    await rollup_payments(session, *criteria, sign=sign)
+    await session.exec(balance_payments_statement(*criteria, sign=sign))
+
+
+async def get_payment_group_id(session: AsyncSession, student_id: int) -> int | None:
+    """
+    Group a new payment of the student is accounted to: the first one joined.
+    """
+    statement = (
+        select(GroupStudentLink.group_id)
+        .where(GroupStudentLink.student_id == student_id)
+        .order_by(GroupStudentLink.joined_at, GroupStudentLink.group_id)
+        .limit(1)
+    )
+    return (await session.exec(statement)).first()
+
+
+def _balance_upsert(columns: list[str], totals: Select[Any]) -> Insert:
+    statement = insert(StudentBalance).from_select(
+        ["student_id", "month", "lessons_attended", "amount_paid"], totals
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[StudentBalance.student_id, StudentBalance.month],
+        set_={
+            column: getattr(StudentBalance, column) + statement.excluded[column]
+            for column in columns
+        },
+    )
+
+
+def balance_attendance_statement(*criteria: ColumnElement[bool], sign: int) -> Insert:
+    """
+    Add (sign=1) or remove (sign=-1) the attendances matching `criteria`
+    from the student balances.
+    """
+    month = _month(Lesson.day)
+    totals = (
+        select(LessonStudentLink.student_id, month, sign * func.count(), literal(0))
+        .join(Lesson, Lesson.id == LessonStudentLink.lesson_id)
+        .where(*criteria)
+        .group_by(LessonStudentLink.student_id, month)
+    )
+    return _balance_upsert(["lessons_attended"], totals)
+
+
+def balance_payments_statement(*criteria: ColumnElement[bool], sign: int) -> Insert:
+    """
+    Add (sign=1) or remove (sign=-1) the payments matching `criteria` from
+    the student balances. Only tuition payments count, see `TUITION_REASONS`.
+    """
+    month = _month(Payment.day)
+    totals = (
+        select(Payment.student_id, month, literal(0), sign * func.sum(Payment.amount))
+        .where(col(Payment.reason).in_(TUITION_REASONS), *criteria)
+        .group_by(Payment.student_id, month)
+    )
+    return _balance_upsert(["amount_paid"], totals)
+
+
+async def account_attendance(
+    session: AsyncSession, *criteria: ColumnElement[bool], sign: int = 1
+) -> None:
+    """
+    Apply lesson attendances to the student balances. Must run in the
+    transaction that writes them: after the lesson and its assistants are
+    flushed when adding, before they are changed or deleted when removing.
+    """
+    await session.exec(balance_attendance_statement(*criteria, sign=sign))
+
+
+def student_balances_statement() -> Select[Any]:
+    """
+    Balance of every student from the monthly totals: the lessons attended
+    priced at `LESSON_PRICE`, capped at `MONTHLY_FEE` per month, minus the
+    amount paid. Raises `BalancesNotConfigured` until both prices are set.
+    """
+    if settings.LESSON_PRICE is None or settings.MONTHLY_FEE is None:
+        raise BalancesNotConfigured()
+    amount_due = StudentBalance.lessons_attended * settings.LESSON_PRICE
+    if settings.MONTHLY_FEE:
+        amount_due = func.least(amount_due, settings.MONTHLY_FEE)
+    amount_due = func.sum(amount_due)
+    amount_paid = func.sum(StudentBalance.amount_paid)
+    return (
+        select(
+            StudentBalance.student_id,
+            Student.full_name,
+            func.sum(StudentBalance.lessons_attended).label("lessons_attended"),
+            amount_due.label("amount_due"),
+            amount_paid.label("amount_paid"),
+            (amount_due - amount_paid).label("owed"),
+        )
+        .join(Student, Student.id == StudentBalance.student_id)
+        .group_by(StudentBalance.student_id, Student.full_name)
+    )
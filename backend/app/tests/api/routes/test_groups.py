@@ -0,0 +1,125 @@
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import GroupStudentLink
+from app.tests.utils.student import (
+    create_lesson,
+    create_random_group,
+    create_random_student,
+)
+
+
+def test_read_group_attendance(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    first = create_random_student(db, group)
+    second = create_random_student(db, group)
+    absent = create_random_student(db, group)
+    start = datetime.date(2024, 3, 4)
+    lessons = [
+        create_lesson(db, group, start, assistants=[first, second]),
+        create_lesson(
+            db, group, start + datetime.timedelta(days=7), assistants=[second]
+        ),
+        create_lesson(db, group, start + datetime.timedelta(days=14)),
+        create_lesson(
+            db, group, start + datetime.timedelta(days=21), assistants=[first]
+        ),
+    ]
+    r = client.get(
+        f"{settings.API_V1_STR}/groups/{group.id}/attendance",
+        headers=superuser_token_headers,
+        params={"from": "2024-03-01", "to": "2024-03-20"},
+    )
+    assert r.status_code == 200
+    assert r.json() == {
+        "group_id": group.id,
+        "students": [first.id, second.id, absent.id],
+        "lessons": [lesson.id for lesson in lessons[:3]],
+        "days": ["2024-03-04", "2024-03-11", "2024-03-18"],
+        "presence": ["100", "110", "000"],
+    }
+
+
+def test_read_group_attendance_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/groups/999999/attendance",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+
+
+def test_read_group_attendance_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/groups/{group.id}/attendance",
+        headers={**normal_user_token_headers, "If-None-Match": "*"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Not enough permissions"
+
+
+def test_delete_group_reports(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "LESSON_PRICE", 1000)
+    monkeypatch.setattr(settings, "MONTHLY_FEE", 3000)
+    group = create_random_group(db)
+    other_group = create_random_group(db)
+    student = create_random_student(db, group)
+    db.add(GroupStudentLink(group_id=other_group.id, student_id=student.id))
+    db.commit()
+    for lesson_group, day in [(group, "2024-05-06"), (other_group, "2024-05-07")]:
+        r = client.post(
+            f"{settings.API_V1_STR}/lessons/",
+            headers=superuser_token_headers,
+            json={"day": day, "group_id": lesson_group.id, "assistants": [student.id]},
+        )
+        assert r.status_code == 200
+    r = client.post(
+        f"{settings.API_V1_STR}/payments/",
+        headers=superuser_token_headers,
+        json={
+            "student_id": student.id,
+            "day": "2024-05-01",
+            "amount": 500,
+            "reason": "one_lesson",
+            "notes": "",
+        },
+    )
+    assert r.status_code == 200
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/groups/{group.id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    # Only the lesson of the other group is left to pay
+    r = client.get(
+        f"{settings.API_V1_STR}/students/balances",
+        headers=superuser_token_headers,
+        params={"group_id": other_group.id},
+    )
+    assert r.status_code == 200
+    assert [(row["lessons_attended"], row["owed"]) for row in r.json()["data"]] == [
+        (1, 500)
+    ]
+    # The payment is still accounted to the removed group
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/summary",
+        headers=superuser_token_headers,
+        params={"group_id": group.id},
+    )
+    assert r.status_code == 200
+    assert r.json()["amount"] == 500
@@ -0,0 +1,262 @@
+import datetime
+import threading
+import time
+from typing import Any
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import Lesson
+from app.tests.utils.student import (
+    create_lesson,
+    create_random_group,
+    create_random_student,
+)
+
+
+def test_read_lessons_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    start = datetime.date(2024, 3, 1)
+    lessons = [
+        create_lesson(db, group, start + datetime.timedelta(days=i)) for i in range(5)
+    ]
+    r = client.get(
+        f"{settings.API_V1_STR}/lessons/",
+        headers=superuser_token_headers,
+        params={"group_id": group.id, "limit": 3},
+    )
+    first = r.json()
+    assert [lesson["id"] for lesson in first["data"]] == [
+        lesson.id for lesson in lessons[:1:-1]
+    ]
+    r = client.get(
+        f"{settings.API_V1_STR}/lessons/",
+        headers=superuser_token_headers,
+        params={"group_id": group.id, "limit": 3, "cursor": first["next_cursor"]},
+    )
+    second = r.json()
+    assert [lesson["id"] for lesson in second["data"]] == [
+        lesson.id for lesson in lessons[1::-1]
+    ]
+    assert second["next_cursor"] is None
+
+
+def test_read_lessons_day_range(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    lessons = [
+        create_lesson(db, group, datetime.date(2024, month, 15)) for month in (2, 3, 4)
+    ]
+    r = client.get(
+        f"{settings.API_V1_STR}/lessons/",
+        headers=superuser_token_headers,
+        params={"group_id": group.id, "day_from": "2024-03-01", "day_to": "2024-04-15"},
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert [lesson["id"] for lesson in result["data"]] == [lessons[2].id, lessons[1].id]
+    assert result["count"] == 2
+
+
+def test_read_lessons_constant_query_count(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    students = [create_random_student(db, group) for _ in range(3)]
+    start = datetime.date(2024, 4, 1)
+    for i in range(6):
+        create_lesson(db, group, start + datetime.timedelta(days=i), students)
+    group_id = group.id
+
+    def count_queries(limit: int) -> int:
+        statements: list[str] = []
+
+        def before_cursor_execute(*args: Any) -> None:
+            statements.append(args[2])
+
+        # The route runs on the async engine
+        target = async_engine.sync_engine
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+        try:
+            r = client.get(
+                f"{settings.API_V1_STR}/lessons/",
+                headers=superuser_token_headers,
+                params={"group_id": group_id, "limit": limit},
+            )
+        finally:
+            event.remove(target, "before_cursor_execute", before_cursor_execute)
+        assert r.status_code == 200
+        assert len(r.json()["data"]) == limit
+        return len(statements)
+
+    # Warm the user cache so both counts see the same authentication queries
+    count_queries(1)
+    queries = count_queries(1)
+    assert queries == count_queries(6)
+    # Table versions, group, page, then one query per loaded relationship:
+    # group.student_links, assistants and assistants.group_links
+    assert queries <= 6
+
+
+def test_generate_lessons(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    student = create_random_student(db, group)
+    # Mondays and Wednesdays of the first two weeks of July 2024
+    existing = create_lesson(db, group, datetime.date(2024, 7, 3))
+    data = {
+        "group_id": group.id,
+        "day_from": "2024-07-01",
+        "day_to": "2024-07-14",
+        "weekdays": [0, 2],
+        "with_assistants": True,
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/lessons/generate",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert [lesson["day"] for lesson in content["data"]] == [
+        "2024-07-01",
+        "2024-07-08",
+        "2024-07-10",
+    ]
+    assert existing.id not in [lesson["id"] for lesson in content["data"]]
+    for lesson in content["data"]:
+        assert [a["id"] for a in lesson["assistants"]] == [student.id]
+    r = client.post(
+        f"{settings.API_V1_STR}/lessons/generate",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert r.json() == {"data": [], "count": 0, "next_cursor": None}
+
+
+def test_generate_lessons_concurrent_insert(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    results: list[Any] = []
+    # Another transaction takes one of the days and commits while the
+    # generation waits on it
+    with Session(engine) as other:
+        other.add(Lesson(group_id=group.id, day=datetime.date(2024, 9, 4)))
+        other.flush()
+        request = threading.Thread(
+            target=lambda: results.append(
+                client.post(
+                    f"{settings.API_V1_STR}/lessons/generate",
+                    headers=superuser_token_headers,
+                    json={
+                        "group_id": group.id,
+                        "day_from": "2024-09-02",
+                        "day_to": "2024-09-06",
+                        "weekdays": [0, 2],
+                    },
+                )
+            )
+        )
+        request.start()
+        # Until the generation waits for the uncommitted lesson
+        for _ in range(100):
+            waiting = db.exec(
+                text(
+                    "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'"
+                )
+            ).one()[0]
+            db.commit()
+            if waiting:
+                break
+            time.sleep(0.05)
+        other.commit()
+    request.join()
+    r = results[0]
+    assert r.status_code == 200
+    assert [lesson["day"] for lesson in r.json()["data"]] == ["2024-09-02"]
+
+
+def test_generate_lessons_invalid_range(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    data = {
+        "group_id": group.id,
+        "day_from": "2024-07-14",
+        "day_to": "2024-07-01",
+        "weekdays": [0],
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/lessons/generate",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert r.status_code == 422
+
+
+def test_read_lesson_etag_follows_assistants(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    student = create_random_student(db, group)
+    lesson = create_lesson(db, group, datetime.date(2024, 3, 1))
+    url = f"{settings.API_V1_STR}/lessons/{lesson.id}"
+    r = client.get(url, headers=superuser_token_headers)
+    etag = r.headers["ETag"]
+    headers = {**superuser_token_headers, "If-None-Match": etag}
+    assert client.get(url, headers=headers).status_code == 304
+
+    r = client.put(
+        url,
+        headers=superuser_token_headers,
+        json={"day": "2024-03-01", "assistants": [student.id]},
+    )
+    assert r.status_code == 200
+    r = client.get(url, headers=headers)
+    assert r.status_code == 200
+    assert [assistant["id"] for assistant in r.json()["assistants"]] == [student.id]
+
+
+def test_lesson_assistants_must_be_members(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    member = create_random_student(db, group)
+    outsider = create_random_student(db)
+    r = client.post(
+        f"{settings.API_V1_STR}/lessons/",
+        headers=superuser_token_headers,
+        json={
+            "day": "2024-03-04",
+            "group_id": group.id,
+            "assistants": [member.id, outsider.id],
+        },
+    )
+    assert r.status_code == 404
+    assert (
+        r.json()["detail"]
+        == f"Student {outsider.id} is not registered in course {group.id}"
+    )
+
+    lesson = create_lesson(db, group, datetime.date(2024, 3, 4), assistants=[member])
+    r = client.put(
+        f"{settings.API_V1_STR}/lessons/{lesson.id}",
+        headers=superuser_token_headers,
+        json={"day": "2024-03-04", "assistants": [member.id, 999999]},
+    )
+    assert r.status_code == 404
+    assert (
+        r.json()["detail"] == f"Student 999999 is not registered in course {group.id}"
+    )
+    r = client.get(
+        f"{settings.API_V1_STR}/lessons/{lesson.id}", headers=superuser_token_headers
+    )
+    assert [assistant["id"] for assistant in r.json()["assistants"]] == [member.id]
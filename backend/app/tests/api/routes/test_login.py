@@ -1,7 +1,19 @@
+import asyncio
+import threading
+from typing import Any
+
+import pytest
+from fastapi import Request
 from fastapi.testclient import TestClient
 from pytest_mock import MockerFixture
 
+from app import crud
+from app.api.deps import get_client_ip
 from app.core.config import settings
+from app.core.db import async_engine
+from app.core.ratelimit import memory_store
+from app.main import app
+from app.tests.utils.utils import random_email
 from app.utils import generate_password_reset_token
 
 
@@ -92,3 +104,126 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def test_get_access_token_password_queue_full(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "PASSWORD_HASH_QUEUE_SIZE", 0)
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+
+def test_get_access_token_releases_connection(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    logins = 4
+    checked_out = []
+    hashing = 0
+    all_hashing = asyncio.Event()
+
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        # Wait for every login to be hashing at the same time
+        nonlocal hashing
+        hashing += 1
+        if hashing == logins:
+            all_hashing.set()
+        await asyncio.wait_for(all_hashing.wait(), timeout=10)
+        checked_out.append(async_engine.pool.checkedout())
+        return True
+
+    monkeypatch.setattr(crud, "verify_password_async", verify_password_async)
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    results = []
+    requests = [
+        threading.Thread(
+            target=lambda: results.append(
+                client.post(
+                    f"{settings.API_V1_STR}/login/access-token", data=login_data
+                )
+            )
+        )
+        for _ in range(logins)
+    ]
+    for request in requests:
+        request.start()
+    for request in requests:
+        request.join()
+    assert [r.status_code for r in results] == [200] * logins
+    assert checked_out == [0] * logins
+
+
+@pytest.mark.parametrize("store", ["memory", "postgres"])
+def test_get_access_token_rate_limited(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, store: str
+) -> None:
+    monkeypatch.setattr(settings, "LOGIN_RATE_LIMIT_STORE", store)
+    monkeypatch.setattr(settings, "LOGIN_EMAIL_BURST", 2)
+    monkeypatch.setattr(settings, "LOGIN_EMAIL_PER_MINUTE", 1)
+    login_data = {"username": random_email(), "password": "incorrect"}
+    for _ in range(2):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+        assert r.status_code == 400
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 429
+    assert 0 < int(r.headers["Retry-After"]) <= 60
+    # Other emails are not affected
+    login_data["username"] = random_email()
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "peer,forwarded_for,client_ip",
+    [
+        ("203.0.113.7", "198.51.100.1", "203.0.113.7"),
+        ("10.0.0.2", None, "10.0.0.2"),
+        ("10.0.0.2", "198.51.100.1", "198.51.100.1"),
+        ("10.0.0.2", "192.0.2.9, 198.51.100.1, 10.0.0.3", "198.51.100.1"),
+        ("10.0.0.2", "10.0.0.4, 10.0.0.3", "10.0.0.4"),
+    ],
+)
+def test_get_client_ip(
+    monkeypatch: pytest.MonkeyPatch,
+    peer: str,
+    forwarded_for: str | None,
+    client_ip: str,
+) -> None:
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["10.0.0.0/8"])
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    request = Request({"type": "http", "client": (peer, 50000), "headers": headers})
+    assert get_client_ip(request) == client_ip
+
+
+@pytest.mark.parametrize("peer,limited", [("10.0.0.2", False), ("203.0.113.7", True)])
+def test_get_access_token_rate_limited_forwarded_for(
+    monkeypatch: pytest.MonkeyPatch, peer: str, limited: bool
+) -> None:
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["10.0.0.0/8"])
+    monkeypatch.setattr(settings, "LOGIN_IP_BURST", 1)
+    monkeypatch.setattr(settings, "LOGIN_IP_PER_MINUTE", 1)
+    memory_store.clear()
+
+    async def behind_proxy(scope: Any, receive: Any, send: Any) -> None:
+        await app(dict(scope, client=(peer, 50000)), receive, send)
+
+    client = TestClient(behind_proxy)
+    # Clients behind a trusted proxy have their own bucket, the header of
+    # anyone else is ignored
+    statuses = []
+    for forwarded_for in ["198.51.100.1", "198.51.100.2"]:
+        r = client.post(
+            f"{settings.API_V1_STR}/login/access-token",
+            data={"username": random_email(), "password": "incorrect"},
+            headers={"X-Forwarded-For": forwarded_for},
+        )
+        statuses.append(r.status_code)
+    assert statuses == [400, 429 if limited else 400]
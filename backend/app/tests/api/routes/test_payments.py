@@ -0,0 +1,220 @@
+import csv
+import datetime
+import io
+import json
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.tests.utils.student import (
+    create_payment,
+    create_random_group,
+    create_random_student,
+)
+
+
+def _summary(client: TestClient, headers: dict[str, str], group_id: int) -> dict:
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/summary",
+        headers=headers,
+        params={"group_id": group_id},
+    )
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_payments_summary_follows_writes(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    student = create_random_student(db, group)
+    payments = []
+    for day, amount in [("2024-03-05", 1000), ("2024-03-20", 500), ("2024-04-02", 700)]:
+        r = client.post(
+            f"{settings.API_V1_STR}/payments/",
+            headers=superuser_token_headers,
+            json={
+                "student_id": student.id,
+                "day": day,
+                "amount": amount,
+                "method": "cash",
+                "notes": "",
+            },
+        )
+        assert r.status_code == 200
+        payments.append(r.json())
+
+    summary = _summary(client, superuser_token_headers, group.id)
+    assert [
+        (row["month"], row["amount"], row["payments"]) for row in summary["data"]
+    ] == [
+        ("2024-03-01", 1500, 2),
+        ("2024-04-01", 700, 1),
+    ]
+    assert summary["amount"] == 2200
+    assert summary["payments"] == 3
+
+    r = client.put(
+        f"{settings.API_V1_STR}/payments/{payments[1]['id']}",
+        headers=superuser_token_headers,
+        json={"day": "2024-04-10", "amount": 300, "method": "cash", "notes": ""},
+    )
+    assert r.status_code == 200
+    updated = r.json()
+    assert (updated["day"], updated["amount"]) == ("2024-04-10", 300)
+    assert updated["student"]["id"] == student.id
+    assert [link["group_id"] for link in updated["student"]["group_links"]] == [
+        group.id
+    ]
+    r = client.delete(
+        f"{settings.API_V1_STR}/payments/{payments[2]['id']}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+
+    summary = _summary(client, superuser_token_headers, group.id)
+    assert [
+        (row["month"], row["amount"], row["payments"]) for row in summary["data"]
+    ] == [
+        ("2024-03-01", 1000, 1),
+        ("2024-04-01", 300, 1),
+    ]
+    assert summary["amount"] == 1300
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/students/{student.id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    summary = _summary(client, superuser_token_headers, group.id)
+    assert summary["data"] == []
+    assert summary["amount"] == 0
+
+
+def test_export_payments(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    student = create_random_student(db)
+    payments = [
+        create_payment(db, student, datetime.date(2024, 1, 15), amount=1000),
+        create_payment(db, student, datetime.date(2024, 2, 15), amount=2000),
+        create_payment(db, student, datetime.date(2024, 3, 15), amount=3000),
+    ]
+    params = {"student_id": student.id, "day_from": "2024-02-01"}
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/export",
+        headers=superuser_token_headers,
+        params=params,
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [(int(row["id"]), row["day"], int(row["amount"])) for row in rows] == [
+        (payments[1].id, "2024-02-15", 2000),
+        (payments[2].id, "2024-03-15", 3000),
+    ]
+    assert rows[0]["student_full_name"] == student.full_name
+
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/export",
+        headers=superuser_token_headers,
+        params={**params, "format": "ndjson"},
+    )
+    assert r.status_code == 200
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["id"] for row in rows] == [payments[1].id, payments[2].id]
+    assert rows[0]["day"] == "2024-02-15"
+    assert rows[0]["notes"] == payments[1].notes
+
+
+def test_export_payments_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/export", headers=normal_user_token_headers
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Not enough permissions"
+
+
+def test_read_payments_filters(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    student = create_random_student(db)
+    payments = [
+        create_payment(db, student, datetime.date(2024, 2, 28), method="cash"),
+        create_payment(
+            db, student, datetime.date(2024, 3, 1), method="cash", amount=500
+        ),
+        create_payment(db, student, datetime.date(2024, 3, 15), method="bank_transfer"),
+        create_payment(
+            db, student, datetime.date(2024, 3, 31), method="cash", amount=2000
+        ),
+        create_payment(
+            db, student, datetime.date(2024, 3, 31), method="cash", amount=1500
+        ),
+        create_payment(db, student, datetime.date(2024, 4, 1), method="cash"),
+    ]
+    params = {
+        "student_id": student.id,
+        "day_from": "2024-03-01",
+        "day_to": "2024-03-31",
+        "method": "cash",
+    }
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/",
+        headers=superuser_token_headers,
+        params=params,
+    )
+    assert r.status_code == 200
+    result = r.json()
+    # Most recent first, ties by id
+    assert [payment["id"] for payment in result["data"]] == [
+        payments[4].id,
+        payments[3].id,
+        payments[1].id,
+    ]
+    assert result["count"] == 3
+
+    r = client.get(
+        f"{settings.API_V1_STR}/payments/",
+        headers=superuser_token_headers,
+        params={**params, "amount_min": 1000, "amount_max": 1800},
+    )
+    assert r.status_code == 200
+    assert [payment["id"] for payment in r.json()["data"]] == [payments[4].id]
+
+
+def test_read_payments_sparse_fieldsets(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    student = create_random_student(db)
+    payment = create_payment(db, student, datetime.date(2024, 5, 2), amount=1200)
+    url = f"{settings.API_V1_STR}/payments/"
+    params = {"student_id": student.id, "fields": "id,day,amount"}
+    r = client.get(url, headers=superuser_token_headers, params=params)
+    assert r.status_code == 200
+    assert r.json() == {
+        "data": [{"id": payment.id, "day": "2024-05-02", "amount": 1200}],
+        "count": 1,
+        "next_cursor": None,
+    }
+    # Sparse responses are conditional too
+    headers = {**superuser_token_headers, "If-None-Match": r.headers["ETag"]}
+    r = client.get(url, headers=headers, params=params)
+    assert r.status_code == 304
+
+    r = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={**params, "include": "student"},
+    )
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert data[0]["student"]["full_name"] == student.full_name
+    assert set(data[0]) == {"id", "day", "amount", "student"}
+
+    for bad in ({"fields": "id,student"}, {"fields": "nope"}, {"include": "group"}):
+        r = client.get(url, headers=superuser_token_headers, params=bad)
+        assert r.status_code == 400
@@ -0,0 +1,434 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.api.routes import students
+from app.core.config import settings
+from app.models import Student, TableVersion
+from app.tests.utils.student import create_random_group, create_random_student
+from app.tests.utils.utils import random_lower_string
+
+
+def test_read_students_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    students = [create_random_student(db, group) for _ in range(5)]
+    params: dict[str, str | int] = {"group_id": group.id, "limit": 2}
+    seen = []
+    while True:
+        r = client.get(
+            f"{settings.API_V1_STR}/students/",
+            headers=superuser_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        content = r.json()
+        assert content["count"] == 5
+        seen += [s["id"] for s in content["data"]]
+        if not content["next_cursor"]:
+            break
+        params["cursor"] = content["next_cursor"]
+    assert seen == [s.id for s in students]
+
+
+def test_read_students_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/students/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
+def test_read_students_count_modes(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    for _ in range(3):
+        create_random_student(db, group)
+    url = f"{settings.API_V1_STR}/students/"
+    params: dict[str, str | int] = {"group_id": group.id, "count": "none"}
+    r = client.get(url, headers=superuser_token_headers, params=params)
+    assert r.json()["count"] is None
+    assert len(r.json()["data"]) == 3
+    params = {"group_id": group.id, "skip": 10}
+    r = client.get(url, headers=superuser_token_headers, params=params)
+    assert r.json() == {"data": [], "count": 3, "next_cursor": None}
+    r = client.get(url, headers=superuser_token_headers, params={"count": "estimate"})
+    assert r.status_code == 200
+    assert r.json()["count"] >= 3
+
+
+def test_import_students_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    content = (
+        "full_name,city,responsible_adult_phone_number,groups\n"
+        f"Ana,Rosario,341555,{group.id}\n"
+        ",Rosario,,\n"
+        "Bea,,not-a-phone,\n"
+        "Carla,,,999999\n"
+        "Dana,,,\n"
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/students/import",
+        headers=superuser_token_headers,
+        files={"file": ("students.csv", content, "text/csv")},
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert len(result["created"]) == 2
+    assert [error["row"] for error in result["errors"]] == [3, 4, 5]
+    assert result["errors"][2]["errors"] == ["groups: Group 999999 not found"]
+    r = client.get(
+        f"{settings.API_V1_STR}/students/",
+        headers=superuser_token_headers,
+        params={"group_id": group.id},
+    )
+    assert [s["id"] for s in r.json()["data"]] == result["created"][:1]
+
+
+def test_import_students_ndjson(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    content = '{"full_name": "Eva", "groups": []}\n\n{"full_name": \n'
+    r = client.post(
+        f"{settings.API_V1_STR}/students/import",
+        headers=superuser_token_headers,
+        files={"file": ("students.ndjson", content, "application/x-ndjson")},
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert len(result["created"]) == 1
+    assert result["errors"] == [{"row": 3, "errors": ["Invalid JSON"]}]
+
+
+def test_read_student_balances(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "LESSON_PRICE", 1000)
+    monkeypatch.setattr(settings, "MONTHLY_FEE", 3000)
+    group = create_random_group(db)
+    debtor = create_random_student(db, group)
+    paid_up = create_random_student(db, group)
+    lessons = []
+    for day in ["2024-03-04", "2024-03-11", "2024-03-18", "2024-03-25", "2024-04-01"]:
+        r = client.post(
+            f"{settings.API_V1_STR}/lessons/",
+            headers=superuser_token_headers,
+            json={
+                "day": day,
+                "group_id": group.id,
+                "assistants": [debtor.id, paid_up.id],
+            },
+        )
+        assert r.status_code == 200
+        lessons.append(r.json())
+    for student, day, amount, reason in [
+        (debtor, "2024-03-01", 1000, "one_lesson"),
+        (paid_up, "2024-03-01", 3000, "one_month"),
+        (paid_up, "2024-04-01", 1000, "one_lesson"),
+    ]:
+        r = client.post(
+            f"{settings.API_V1_STR}/payments/",
+            headers=superuser_token_headers,
+            json={
+                "student_id": student.id,
+                "day": day,
+                "amount": amount,
+                "reason": reason,
+                "notes": "",
+            },
+        )
+        assert r.status_code == 200
+
+    def balances() -> dict:
+        r = client.get(
+            f"{settings.API_V1_STR}/students/balances",
+            headers=superuser_token_headers,
+            params={"group_id": group.id},
+        )
+        assert r.status_code == 200
+        return r.json()
+
+    # March is capped at the monthly fee, April has a single lesson
+    content = balances()
+    assert content["count"] == 1
+    assert content["data"] == [
+        {
+            "student_id": debtor.id,
+            "full_name": debtor.full_name,
+            "lessons_attended": 5,
+            "amount_due": 4000,
+            "amount_paid": 1000,
+            "owed": 3000,
+        }
+    ]
+
+    r = client.put(
+        f"{settings.API_V1_STR}/lessons/{lessons[-1]['id']}",
+        headers=superuser_token_headers,
+        json={"day": "2024-04-01", "assistants": [paid_up.id]},
+    )
+    assert r.status_code == 200
+    assert balances()["data"][0]["owed"] == 2000
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/lessons/{lessons[0]['id']}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert balances()["data"][0]["owed"] == 2000
+
+    # Payments for anything but tuition don't reduce the balance
+    r = client.post(
+        f"{settings.API_V1_STR}/payments/",
+        headers=superuser_token_headers,
+        json={
+            "student_id": debtor.id,
+            "day": "2024-03-01",
+            "amount": 2000,
+            "reason": "other",
+            "notes": "",
+        },
+    )
+    assert r.status_code == 200
+    payment = r.json()
+    assert balances()["data"][0]["amount_paid"] == 1000
+
+    r = client.put(
+        f"{settings.API_V1_STR}/payments/{payment['id']}",
+        headers=superuser_token_headers,
+        json={"day": "2024-03-01", "amount": 2000, "reason": "one_month"},
+    )
+    assert r.status_code == 200
+    assert balances()["count"] == 0
+
+
+def test_read_student_balances_not_configured(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "LESSON_PRICE", None)
+    r = client.get(
+        f"{settings.API_V1_STR}/students/balances", headers=superuser_token_headers
+    )
+    assert r.status_code == 503
+    assert "LESSON_PRICE" in r.json()["detail"]
+
+
+def test_read_students_etag(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group = create_random_group(db)
+    student = create_random_student(db, group)
+    url = f"{settings.API_V1_STR}/students/"
+    params = {"group_id": group.id}
+    r = client.get(url, headers=superuser_token_headers, params=params)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    headers = {**superuser_token_headers, "If-None-Match": etag}
+    r = client.get(url, headers=headers, params=params)
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.content == b""
+    # Another page is another response
+    r = client.get(url, headers=headers, params={**params, "limit": 1})
+    assert r.status_code == 200
+
+    r = client.put(
+        f"{settings.API_V1_STR}/students/{student.id}",
+        headers=superuser_token_headers,
+        json={"full_name": "Renamed", "groups": [group.id]},
+    )
+    assert r.status_code == 200
+    r = client.get(url, headers=headers, params=params)
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()["data"][0]["full_name"] == "Renamed"
+
+
+def test_table_version_bumped_once_per_transaction(db: Session) -> None:
+    def version() -> int:
+        db.expire_all()
+        table_version = db.get(TableVersion, "student")
+        return table_version.version if table_version else 0
+
+    before = version()
+    for _ in range(2):
+        db.add(Student(full_name=random_lower_string()))
+        db.flush()
+    db.commit()
+    assert version() == before + 1
+
+    db.add(Student(full_name=random_lower_string()))
+    db.flush()
+    db.rollback()
+    db.commit()
+    assert version() == before + 1
+
+
+def test_read_student_etag_checked_after_permissions(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    student = create_random_student(db, create_random_group(db))
+    url = f"{settings.API_V1_STR}/students/{student.id}"
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": "*"})
+    assert r.status_code == 400
+    assert "ETag" not in r.headers
+
+    # Each caller has its own ETag
+    url = f"{settings.API_V1_STR}/students/"
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    r = client.get(
+        url, headers={**normal_user_token_headers, "If-None-Match": r.headers["ETag"]}
+    )
+    assert r.status_code == 200
+
+
+def test_search_students(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    name = random_lower_string()
+    typo = name[:10] + name[11:]
+    exact = Student(full_name=f"{name} Smith", city="Lyon")
+    guardian = Student(full_name="Anna Smith", responsible_adult_full_name=typo)
+    db.add(exact)
+    db.add(guardian)
+    db.commit()
+    url = f"{settings.API_V1_STR}/students/search"
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": name})
+    assert r.status_code == 200
+    result = r.json()
+    assert [student["id"] for student in result["data"]] == [exact.id, guardian.id]
+    assert result["count"] == 2
+
+    r = client.get(
+        url, headers=superuser_token_headers, params={"q": typo, "skip": 1, "limit": 1}
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert [student["id"] for student in result["data"]] == [exact.id]
+    assert result["count"] == 2
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": "x"})
+    assert r.status_code == 422
+
+
+def test_batch_get_students(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    students = [create_random_student(db) for _ in range(3)]
+    ids = [students[2].id, students[0].id, 0, students[2].id, students[1].id]
+    expected = [students[2].id, students[0].id, students[1].id]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/students/",
+        headers=superuser_token_headers,
+        params={"ids": ",".join(str(id) for id in ids)},
+    )
+    assert r.status_code == 200
+    result = r.json()
+    assert [student["id"] for student in result["data"]] == expected
+    assert result["count"] == 3
+
+    r = client.post(
+        f"{settings.API_V1_STR}/students/batch-get",
+        headers=superuser_token_headers,
+        params={"fields": "id,full_name"},
+        json={"ids": ids},
+    )
+    assert r.status_code == 200
+    assert r.json()["data"] == [
+        {"id": id, "full_name": next(s.full_name for s in students if s.id == id)}
+        for id in expected
+    ]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/students/",
+        headers=superuser_token_headers,
+        params={"ids": "1,x"},
+    )
+    assert r.status_code == 400
+
+
+def test_read_students_query_stats(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    create_random_student(db)
+    url = f"{settings.API_V1_STR}/students/"
+    r = client.get(url, headers=superuser_token_headers)
+    assert "Server-Timing" not in r.headers
+
+    monkeypatch.setattr(settings, "QUERY_STATS", True)
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    match = re.fullmatch(
+        r'db;dur=[\d.]+;desc="(\d+) queries", db-slowest;dur=[\d.]+',
+        r.headers["Server-Timing"],
+    )
+    assert match and int(match.group(1)) >= 2
+    record = next(
+        record for record in caplog.records if record.name == "app.core.middleware"
+    )
+    assert record.queries == int(match.group(1))
+    assert record.path == url
+    assert record.slowest_statement.startswith("SELECT")
+
+
+def test_import_students_limits(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    url = f"{settings.API_V1_STR}/students/import"
+    content = "full_name\nAna\nBea\nCarla\n"
+    monkeypatch.setattr(settings, "STUDENT_IMPORT_MAX_ROWS", 2)
+    r = client.post(
+        url,
+        headers=superuser_token_headers,
+        files={"file": ("students.csv", content, "text/csv")},
+    )
+    assert r.status_code == 413
+
+    monkeypatch.setattr(settings, "STUDENT_IMPORT_MAX_ROWS", 3)
+    monkeypatch.setattr(settings, "STUDENT_IMPORT_MAX_BYTES", 10)
+    r = client.post(
+        url,
+        headers=superuser_token_headers,
+        files={"file": ("students.csv", content, "text/csv")},
+    )
+    assert r.status_code == 413
+
+    monkeypatch.setattr(settings, "STUDENT_IMPORT_MAX_BYTES", 1024)
+    # Inserted in two batches
+    monkeypatch.setattr(students, "IMPORT_BATCH_SIZE", 2)
+    r = client.post(
+        url,
+        headers=superuser_token_headers,
+        files={"file": ("students.csv", content, "text/csv")},
+    )
+    assert r.status_code == 200
+    created = r.json()["created"]
+    assert len(created) == 3 and created == sorted(created)
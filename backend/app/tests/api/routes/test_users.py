@@ -5,6 +5,7 @@ from sqlmodel import Session
 from app import crud
 from app.core.config import settings
 from app.models import UserCreate
+from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -335,6 +336,30 @@ def test_update_user(
     assert updated_user["full_name"] == "Updated_full_name"
 
 
+def test_update_user_deactivates_cached_user(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=username, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
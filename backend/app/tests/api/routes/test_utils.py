@@ -0,0 +1,57 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.db import TimedQueuePool, async_engine, engine
+
+
+def test_db_pool_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert [pool["name"] for pool in content["data"]] == ["sync", "async"]
+    assert content["data"][0]["size"] == settings.POSTGRES_POOL_SIZE
+    assert content["data"][0]["checkouts"] > 0
+    assert (
+        content["threadpool_tokens"]
+        == settings.POSTGRES_POOL_SIZE + settings.POSTGRES_MAX_OVERFLOW
+    )
+
+
+def test_db_pool_wait_stats_per_engine() -> None:
+    sync_stats = engine.pool.wait_stats  # type: ignore[attr-defined]
+    assert sync_stats is not async_engine.pool.wait_stats  # type: ignore[attr-defined]
+    pool = TimedQueuePool(lambda: None, pool_size=1)  # type: ignore[arg-type, return-value]
+    assert pool.wait_stats is not sync_stats
+    # Disposing an engine recreates its pool, the stats carry over
+    assert pool.recreate().wait_stats is pool.wait_stats
+
+
+def test_db_pool_stats_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 400
+
+
+def test_user_cache_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    client.get(f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers)
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/user-cache/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    before = r.json()
+    assert before["size"] >= 1
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/user-cache/", headers=superuser_token_headers
+    )
+    after = r.json()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"]
@@ -0,0 +1,119 @@
+import datetime
+
+import pytest
+from sqlmodel import Session, col, delete, select
+
+from app.core.config import settings
+from app.jobs import TASKS, claim_job, enqueue, run_job, run_pending, task
+from app.models import Job
+
+calls: list[str] = []
+
+
+@task("test_record")
+def record(*, value: str) -> None:
+    calls.append(value)
+
+
+@task("test_fail")
+def fail() -> None:
+    raise ValueError("boom")
+
+
+@pytest.fixture(autouse=True)
+def clean_jobs(db: Session) -> None:
+    db.exec(delete(Job))  # type: ignore
+    db.commit()
+    calls.clear()
+
+
+def test_run_pending(db: Session) -> None:
+    enqueue(db, "test_record", value="a")
+    enqueue(db, "test_record", value="b")
+    enqueue(
+        db,
+        "test_record",
+        value="later",
+        run_at=datetime.datetime.now() + datetime.timedelta(hours=1),
+    )
+    db.commit()
+    assert run_pending(db) == 2
+    assert calls == ["a", "b"]
+    # Done jobs are deleted, the future one is still queued
+    jobs = db.exec(select(Job)).all()
+    assert [(job.payload, job.status) for job in jobs] == [
+        ({"value": "later"}, "queued")
+    ]
+
+
+def test_run_job_retries_with_backoff(db: Session) -> None:
+    job = enqueue(db, "test_fail", max_attempts=2)
+    db.commit()
+    claimed = claim_job(db)
+    assert claimed is not None and claimed.id == job.id
+    run_job(db, claimed)
+    db.refresh(job)
+    assert job.status == "queued"
+    assert job.attempts == 1
+    assert job.last_error == "ValueError: boom"
+    assert job.run_at >= datetime.datetime.now() + datetime.timedelta(
+        seconds=settings.JOB_RETRY_BACKOFF / 2 - 1
+    )
+    # Not due yet
+    assert claim_job(db) is None
+
+    job.run_at = datetime.datetime.now()
+    db.add(job)
+    db.commit()
+    assert run_pending(db) == 1
+    db.refresh(job)
+    assert job.status == "failed"
+    assert job.attempts == 2
+
+
+def test_claim_job_reclaims_stale_jobs(db: Session) -> None:
+    job = enqueue(db, "test_record", value="stale")
+    db.commit()
+    assert claim_job(db) is not None
+    assert claim_job(db) is None
+    job.locked_at = datetime.datetime.now() - datetime.timedelta(
+        seconds=settings.JOB_TIMEOUT + 1
+    )
+    db.add(job)
+    db.commit()
+    assert run_pending(db) == 1
+    assert calls == ["stale"]
+    assert not db.exec(select(Job).where(col(Job.id) == job.id)).first()
+
+
+def test_claim_job_fails_stale_jobs_without_attempts_left(db: Session) -> None:
+    job = enqueue(db, "test_record", value="stale", max_attempts=1)
+    db.commit()
+    assert claim_job(db) is not None
+    job.locked_at = datetime.datetime.now() - datetime.timedelta(
+        seconds=settings.JOB_TIMEOUT + 1
+    )
+    db.add(job)
+    db.commit()
+    assert claim_job(db) is None
+    db.refresh(job)
+    assert job.status == "failed"
+    assert job.attempts == 1
+    assert job.last_error == "Timed out"
+    assert calls == []
+
+
+def test_send_email_is_queued(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import utils
+
+    monkeypatch.setattr(settings, "SMTP_HOST", "smtp.example.com")
+    monkeypatch.setattr(settings, "EMAILS_FROM_EMAIL", "info@example.com")
+    utils.send_email(email_to="to@example.com", subject="Hi", html_content="<p>Hi</p>")
+    job = db.exec(select(Job)).one()
+    assert job.name == "send_email"
+    assert job.payload == {
+        "email_to": "to@example.com",
+        "subject": "Hi",
+        "html_content": "<p>Hi</p>",
+    }
+    assert TASKS["send_email"] is utils.deliver_email
@@ -0,0 +1,58 @@
+import datetime
+
+from sqlmodel import Session
+
+from app.models import Group, GroupStudentLink, Lesson, Payment, Student
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_group(db: Session) -> Group:
+    group = Group(name=random_lower_string(), description=random_lower_string())
+    db.add(group)
+    db.commit()
+    db.refresh(group)
+    return group
+
+
+def create_random_student(db: Session, group: Group | None = None) -> Student:
+    student = Student(full_name=random_lower_string())
+    db.add(student)
+    db.commit()
+    if group:
+        db.add(GroupStudentLink(group_id=group.id, student_id=student.id))
+        db.commit()
+    db.refresh(student)
+    return student
+
+
+def create_lesson(
+    db: Session,
+    group: Group,
+    day: datetime.date,
+    assistants: list[Student] | None = None,
+) -> Lesson:
+    lesson = Lesson(day=day, group_id=group.id, assistants=assistants or [])
+    db.add(lesson)
+    db.commit()
+    db.refresh(lesson)
+    return lesson
+
+
+def create_payment(
+    db: Session,
+    student: Student,
+    day: datetime.date,
+    amount: int = 1000,
+    method: str = "other",
+) -> Payment:
+    payment = Payment(
+        student_id=student.id,
+        day=day,
+        amount=amount,
+        method=method,
+        notes=random_lower_string(),
+    )
+    db.add(payment)
+    db.commit()
+    db.refresh(payment)
+    return payment
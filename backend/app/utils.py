@@ -5,10 +5,13 @@ from pathlib import Path
 from typing import Any
 
 import emails  # type: ignore
-from jinja2 import Template
+from jinja2 import Environment, FileSystemLoader
 from jose import JWTError, jwt
+from sqlmodel import Session
 
 from app.core.config import settings
+from app.core.db import engine
+from app.jobs import enqueue, task
 
 
 @dataclass
@@ -17,11 +20,25 @@ class EmailData:
     subject: str
 
 
+# Compiled templates are kept forever, and only checked for changes on disk
+# with EMAIL_TEMPLATES_AUTO_RELOAD
+email_templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+    auto_reload=settings.EMAIL_TEMPLATES_AUTO_RELOAD,
+    cache_size=-1,
+)
+
+
+def load_email_templates() -> None:
+    """
+    Compile every email template up front, at startup.
+    """
+    for template_name in email_templates.list_templates(extensions=["html"]):
+        email_templates.get_template(template_name)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = email_templates.get_template(template_name).render(context)
     return html_content
 
 
@@ -31,7 +48,23 @@ def send_email(
     subject: str = "",
     html_content: str = "",
 ) -> None:
+    """
+    Queue an email, it is sent by the worker.
+    """
     assert settings.emails_enabled, "no provided configuration for email variables"
+    with Session(engine) as session:
+        enqueue(
+            session,
+            "send_email",
+            email_to=email_to,
+            subject=subject,
+            html_content=html_content,
+        )
+        session.commit()
+
+
+@task("send_email")
+def deliver_email(*, email_to: str, subject: str, html_content: str) -> None:
     message = emails.Message(
         subject=subject,
         html=html_content,
@@ -48,6 +81,9 @@ def send_email(
         smtp_options["password"] = settings.SMTP_PASSWORD
     response = message.send(to=email_to, smtp=smtp_options)
     logging.info(f"send email result: {response}")
+    if not response.success:
+        # Raising makes the worker retry later
+        raise RuntimeError(f"Email to {email_to} not sent: {response.error}")
 
 
 def generate_test_email(email_to: str) -> EmailData:
@@ -0,0 +1,39 @@
+import logging
+import signal
+import time
+from types import FrameType
+
+from sqlmodel import Session
+
+from app import utils  # noqa: F401 registers the email tasks
+from app.core.config import settings
+from app.core.db import engine
+from app.jobs import claim_job, run_job
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+stopping = False
+
+
+def stop(signum: int, frame: FrameType | None) -> None:
+    global stopping
+    logger.info("Stopping worker after the current job")
+    stopping = True
+
+
+def main() -> None:
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Worker started")
+    while not stopping:
+        with Session(engine) as session:
+            job = claim_job(session)
+            if job:
+                run_job(session, job)
+                continue
+        time.sleep(settings.JOB_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()